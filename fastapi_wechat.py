@@ -0,0 +1,273 @@
+"""
+WeChat query service – mounted on the main FastAPI app under /wechat.
+
+The backup named by $WECHAT_BACKUP is discovered once; per account the
+contact map, one read-only handle per shard and the per-chat summaries
+(from the CreateTime catalog, see wechat_utils.catalog) stay warm between
+requests.  They are rebuilt, as a new snapshot swapped in whole, only
+when a shard's size/mtime changes.
+"""
+import asyncio
+import json
+import os
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Response
+
+from wechat_utils._helpers import md5_hex, open_ro, utc_iso_fast
+from wechat_utils.catalog import dedup_key_sql, load_catalog, overlaps
+from wechat_utils.dump import (ShardRows, chat_kind, db_chain, dedup_parts,
+                               load_contacts, merge_rows, message_dicts,
+                               ranges_overlap, scan_accounts)
+from wechat_utils.paging import read_page
+from wechat_utils.search import decode_body
+
+MAX_PAGE = 1_000
+
+
+router = APIRouter(
+    prefix="/wechat",
+    tags=["wechat"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+def text_bodies(msgs: List[dict]) -> List[dict]:
+    for msg in msgs:                            # compressed / blob bodies → text
+        if isinstance(msg["body"], bytes):
+            msg["body"] = decode_body(msg["body"])
+    return msgs
+
+
+def shard_stamp(db_dir: Path):
+    return tuple((p.name, p.stat().st_size, p.stat().st_mtime_ns)
+                 for p in db_chain(db_dir))
+
+
+class Snapshot:
+    """
+    One consistent view of an account: contacts, shard handles, catalog,
+    layout and chat summaries, built together and never changed after.
+    """
+
+    def __init__(self, acc_dir: Path):
+        db_dir = acc_dir / "DB"
+        self.stamp = shard_stamp(db_dir)
+        paths = db_chain(db_dir)
+        self.contacts = load_contacts(db_dir / "WCDB_Contact.sqlite")
+        self.by_usrname = {usr: h for h, (usr, _) in self.contacts.items()}
+        self.cons = {p.name: open_ro(p, check_same_thread=False) for p in paths}
+        try:
+            self.catalog = load_catalog(db_dir, paths)
+            # hash → [(shard name, table, span), …] in shard order
+            self.layout: Dict[str, list] = {}
+            for name, tables in self.catalog.items():
+                for table, span in tables.items():
+                    if span.rows:
+                        self.layout.setdefault(table[5:], []).append((name, table, span))
+            self.summaries = {h: self.summarise(h, parts)
+                              for h, parts in self.layout.items()}
+        except Exception:
+            self.close()
+            raise
+        self.listing = sorted(self.summaries.values(),
+                              key=lambda s: s["last_ts"], reverse=True)
+        # serialised once – the listing is the hot, large response
+        self.listing_json = json.dumps(self.listing, ensure_ascii=False).encode()
+
+    def summarise(self, h: str, parts: list) -> dict:
+        usr, nick = self.contacts.get(h, ("<unknown>", ""))
+        if len(parts) > 1 and ranges_overlap((span.min_ts, span.max_ts)
+                                             for _, _, span in parts):
+            # shards overlap in time → possible cross-shard repeats
+            count = sum(1 for _ in dedup_parts(
+                [(name, self.cons[name], table) for name, table, _ in parts],
+                None, None))
+        else:
+            count = sum(span.rows for _, _, span in parts)
+        return {
+            "chat": h,
+            "usrname": usr,
+            "nickname": nick,
+            "chat_type": chat_kind(usr),
+            "message_count": count,
+            "first_ts": utc_iso_fast(min(span.min_ts for _, _, span in parts)),
+            "last_ts": utc_iso_fast(max(span.max_ts for _, _, span in parts)),
+        }
+
+    def resolve(self, chat: str) -> str:
+        """Chat hash from a hash or a UsrName."""
+        h = chat if chat in self.layout else self.by_usrname.get(chat, md5_hex(chat))
+        if h not in self.layout:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return h
+
+    def close(self):
+        for con in self.cons.values():
+            con.close()
+        self.cons = {}
+
+
+class AccountHandle:
+    """
+    Warm state of one account.  A changed shard builds a new Snapshot
+    next to the current one, which is then swapped in whole; every
+    request works from a single snapshot.
+    """
+
+    def __init__(self, acc_dir: Path):
+        self.acc_dir = acc_dir
+        self.lock = threading.Lock()            # one reader per handle set
+        self.reload_lock = threading.Lock()     # one rebuild at a time
+        self.state = Snapshot(acc_dir)
+
+    def refresh(self):
+        """Swap in a new snapshot if any shard changed on disk (a few stat calls)."""
+        if shard_stamp(self.acc_dir / "DB") == self.state.stamp:
+            return
+        with self.reload_lock:
+            if shard_stamp(self.acc_dir / "DB") == self.state.stamp:
+                return                          # another request reloaded
+            fresh = Snapshot(self.acc_dir)
+            with self.lock:                     # no reader is inside the old handles
+                old, self.state = self.state, fresh
+            old.close()
+
+    def summary(self, chat: str) -> dict:
+        state = self.state
+        return state.summaries[state.resolve(chat)]
+
+    def messages(self, chat: str, since: Optional[int], until: Optional[int],
+                 limit: int) -> Tuple[str, List[dict], bool]:
+        """Up to *limit* messages of *chat* in [since, until], oldest first."""
+        with self.lock:
+            state = self.state
+            h = state.resolve(chat)
+            parts = [(name, table, span) for name, table, span in state.layout[h]
+                     if overlaps(span, since, until)]
+            keyed = len(parts) > 1
+            sources = [
+                ShardRows(name, state.cons[name], table, since, until, index=span.index,
+                          key_sql=dedup_key_sql(state.cons[name], table) if keyed else None)
+                for name, table, span in parts
+            ]
+            rows = list(islice(merge_rows(sources, keyed), limit + 1))
+        more = len(rows) > limit
+        return h, text_bodies(message_dicts(rows[:limit]) if rows else []), more
+
+    def page(self, chat: str, limit: int, token: Optional[str]):
+        """One keyset page of *chat* (see wechat_utils.paging)."""
+        with self.lock:
+            state = self.state
+            h = state.resolve(chat)
+            try:
+                page = read_page(self.acc_dir, h, limit, token, state.cons, state.catalog)
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc))
+        return h, text_bodies(page.messages), page.next_token
+
+    def close(self):
+        with self.lock:
+            self.state.close()
+
+
+class WeChatService:
+    """All accounts of one backup, discovered once and kept warm."""
+
+    def __init__(self, backup_root: Path):
+        self.backup_root = Path(backup_root)
+        self.accounts = {acc.name: AccountHandle(acc)
+                         for acc in scan_accounts(self.backup_root)}
+
+    def account(self, uid: str) -> AccountHandle:
+        acc = self.accounts.get(uid)
+        if acc is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+        acc.refresh()
+        return acc
+
+    def close(self):
+        for acc in self.accounts.values():
+            acc.close()
+
+
+_service: Optional[WeChatService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> WeChatService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            root = os.environ.get("WECHAT_BACKUP")
+            if not root:
+                raise HTTPException(status_code=503, detail="WECHAT_BACKUP is not set")
+            _service = WeChatService(Path(root).expanduser())
+        return _service
+
+
+def close_service():
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.close()
+            _service = None
+
+
+async def _account(uid: str) -> AccountHandle:
+    service = await asyncio.to_thread(get_service)
+    return await asyncio.to_thread(service.account, uid)
+
+
+@router.get("/accounts")
+async def list_accounts():
+    service = await asyncio.to_thread(get_service)
+    accounts = []
+    for uid, acc in service.accounts.items():
+        summaries = acc.state.summaries          # one snapshot per account
+        accounts.append({
+            "account_uid": uid,
+            "conversations": len(summaries),
+            "messages": sum(s["message_count"] for s in summaries.values()),
+        })
+    return accounts
+
+
+@router.get("/{account_uid}/conversations")
+async def list_conversations(account_uid: str):
+    """Chat summaries, most recently active first."""
+    acc = await _account(account_uid)
+    return Response(acc.state.listing_json, media_type="application/json")
+
+
+@router.get("/{account_uid}/conversations/{chat}/count")
+async def conversation_count(account_uid: str, chat: str):
+    acc = await _account(account_uid)
+    return acc.summary(chat)
+
+
+@router.get("/{account_uid}/conversations/{chat}/messages")
+async def conversation_messages(account_uid: str, chat: str,
+                                since: Optional[int] = None,
+                                until: Optional[int] = None,
+                                limit: int = 100):
+    """Messages with since <= CreateTime <= until (epoch seconds), oldest first."""
+    if not 1 <= limit <= MAX_PAGE:
+        raise HTTPException(status_code=422, detail=f"limit must be 1..{MAX_PAGE}")
+    acc = await _account(account_uid)
+    h, msgs, more = await asyncio.to_thread(acc.messages, chat, since, until, limit)
+    return {"chat": h, "messages": msgs, "more": more}
+
+
+@router.get("/{account_uid}/conversations/{chat}/page")
+async def conversation_page(account_uid: str, chat: str, limit: int = 500,
+                            cursor: Optional[str] = None):
+    """Keyset page: pass the returned cursor back to get the next one."""
+    if not 1 <= limit <= MAX_PAGE:
+        raise HTTPException(status_code=422, detail=f"limit must be 1..{MAX_PAGE}")
+    acc = await _account(account_uid)
+    h, msgs, next_cursor = await asyncio.to_thread(acc.page, chat, limit, cursor)
+    return {"chat": h, "messages": msgs, "cursor": next_cursor}
@@ -1,10 +1,19 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from typing import Union
 from fastapi import FastAPI
-from . import fastapi_items
+from . import fastapi_items, fastapi_wechat
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    fastapi_wechat.close_service()     # the WeChatService's SQLite handles
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(fastapi_items.router)
+app.include_router(fastapi_wechat.router)
 
 @app.get("/")
 def read_root():
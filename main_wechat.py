@@ -5,75 +5,342 @@ Copyright 2025  •  MIT-licensed
 """
 
 import hashlib
+import bisect
 import csv
+import json
+import os
 import sqlite3
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
 import sys
+import threading
 import click
 
-# ---------- helpers ---------------------------------------------------------
+from wechat_utils.contacts import friend_rows
+from wechat_utils.discovery import discover_accounts
+from wechat_utils.dump import chat_kind
+from wechat_utils.writers import ChatRows, ParquetWriter
 
-def md5_hex(text: str) -> str:
-    return hashlib.md5(text.encode("utf-8")).hexdigest()
+# ---------- helpers ---------------------------------------------------------
 
-def find_accounts(backup_root: Path):
+def find_accounts(backup_root: Path, refresh: bool = False):
     """Yield every Documents/<uid>/ folder that looks like a WeChat account"""
-    for p in (backup_root / "AppDomain-com.tencent.xin" / "Documents").glob("*"):
-        if (p / "DB" / "WCDB_Contact.sqlite").is_file():
-            yield p
+    yield from discover_accounts(backup_root, refresh)
 
 def slice_dbs(db_dir: Path):
-    """Return MM.sqlite + ordered message_n.sqlite paths"""
+    """Return MM.sqlite (if present) + ordered message_n.sqlite paths"""
     mm = db_dir / "MM.sqlite"
     slices = sorted(db_dir.glob("message_*.sqlite"),
                     key=lambda fp: int(fp.stem.split("_")[1]))
-    return [mm, *slices]
+    return [mm, *slices] if mm.exists() else slices
 
 def list_contacts(contact_db: Path):
-    q = ("SELECT UsrName, NickName, Alias "
-         "FROM Friend WHERE UsrName IS NOT NULL")
-    with sqlite3.connect(contact_db) as con:
-        return con.execute(q).fetchall()
-
-def export_messages(slice_paths, hash_, out_csv):
-    rows = []
-    for db in slice_paths:
-        alias = db.stem            # mm / message_n
-        with sqlite3.connect(db) as con:
-            tbl = f"Chat_{hash_}"
-            try:
-                for r in con.execute(
-                        f"SELECT CreateTime,Des,Type,Message,MesLocalID "
-                        f"FROM {tbl}"):
-                    rows.append((*r, alias))
-            except sqlite3.OperationalError:
-                pass  # slice doesn't contain that chat
-    rows.sort(key=lambda r: r[0])  # by CreateTime
-    out_csv.parent.mkdir(parents=True, exist_ok=True)
-    with out_csv.open("w", newline="", encoding="utf-8") as fh:
+    """Return [(md5(UsrName), UsrName, NickName, Alias), …]"""
+    return friend_rows(contact_db)
+
+CSV_HEADER = ["CreateTime","Direction","Type","Message","MesLocalID","Slice"]
+MAX_OPEN_CSV = 64      # cap on simultaneously open per-contact CSV files
+
+class CsvRouter:
+    """Per-contact CSV writers behind an LRU of open file handles"""
+
+    def __init__(self, max_open=MAX_OPEN_CSV):
+        self.max_open = max_open
+        self.handles = OrderedDict()   # path -> (fh, csv.writer)
+        self.counts = {}               # path -> rows written
+        self.slices = {}               # path -> slice aliases seen
+
+    def _writer(self, path: Path):
+        if path in self.handles:
+            self.handles.move_to_end(path)
+            return self.handles[path][1]
+        if len(self.handles) >= self.max_open:
+            _, (fh, _) = self.handles.popitem(last=False)
+            fh.close()
+        fresh = path not in self.counts
+        if fresh:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        fh = path.open("w" if fresh else "a", newline="", encoding="utf-8")
         w = csv.writer(fh)
-        w.writerow(
-            ["CreateTime","Direction","Type","Message","MesLocalID","Slice"])
+        if fresh:
+            w.writerow(CSV_HEADER)
+            self.counts[path] = 0
+            self.slices[path] = set()
+        self.handles[path] = (fh, w)
+        return w
+
+    def write(self, path: Path, rows, alias: str):
+        self._writer(path).writerows(rows)
+        self.counts[path] += len(rows)
+        self.slices[path].add(alias)
+
+    def close(self):
+        for fh, _ in self.handles.values():
+            fh.close()
+        self.handles.clear()
+
+def resort_csv(path: Path):
+    """Stable re-sort of a CSV by CreateTime (rows came from several slices)"""
+    with path.open(newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        header = next(reader)
+        rows = list(reader)
+    rows.sort(key=lambda r: int(r[0]))
+    with path.open("w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh)
+        w.writerow(header)
         w.writerows(rows)
-    return rows
+
+def chat_tables(con: sqlite3.Connection):
+    """Yield (hash, table) for every Chat_<hash> table of a slice"""
+    for (tbl,) in con.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name LIKE 'Chat_%' AND name NOT LIKE 'ChatExt2_%'"):
+        yield tbl[5:], tbl
+
+def conversation_tags(contacts):
+    """
+    {hash: file-name tag}: nick, alias or UsrName, with _<hash[:8]> added
+    where several contacts would otherwise share one file
+    """
+    names = Counter(nick or alias or usr for _, usr, nick, alias in contacts)
+    tags = {}
+    for h, usr, nick, alias in contacts:
+        tag = nick or alias or usr
+        tags[h] = f"{tag}_{h[:8]}" if names[tag] > 1 else tag
+    return tags
+
+def export_account(acc: Path, acc_out: Path, contacts,
+                   media_mode="copy", store=None, parquet=None):
+    """
+    One pass per slice: every Chat_<hash> table is read once and its rows
+    routed to the owning contact's CSV.  Returns {hash: (rows, media)}.
+    With a linking *media_mode*, media goes to the blob *store* instead and
+    acc_out/media-manifest.json maps every conversation to its blobs.
+    With a *parquet* writer the rows go to its dataset instead of CSVs.
+    """
+    targets = {}                       # hash -> (csv path, media dir, tag)
+    usernames = {}
+    tags = conversation_tags(contacts)
+    for h, usr, _, _ in contacts:
+        conv_tag = tags[h]
+        targets[h] = (acc_out / f"{conv_tag}.csv",
+                      acc_out / "media" / conv_tag, conv_tag)
+        usernames[h] = usr
+
+    router = CsvRouter()
+    copier = MediaCopier(acc, mode=media_mode, store=store)
+    media = dict.fromkeys(targets, 0)
+    counts = dict.fromkeys(targets, 0)
+    try:
+        for db in slice_dbs(acc / "DB"):
+            alias = db.stem            # mm / message_n
+            with sqlite3.connect(db) as con:
+                for h, tbl in chat_tables(con):
+                    if h not in targets:
+                        continue       # chat without a Friend row
+                    out_csv, media_dir, conv_tag = targets[h]
+                    raw = con.execute(
+                        f"SELECT CreateTime,Des,Type,Message,MesLocalID "
+                        f"FROM {tbl} ORDER BY CreateTime, rowid").fetchall()
+                    rows = [(*r, alias) for r in raw]
+                    counts[h] += len(rows)
+                    if parquet is not None:
+                        if raw:
+                            parquet.write(ChatRows(
+                                {"account_uid": acc.name, "chat_hash": h,
+                                 "usrname": usernames[h],
+                                 "chat_type": chat_kind(usernames[h])},
+                                iter([raw])))
+                    else:
+                        router.write(out_csv, rows, alias)
+                    media[h] += copier.copy(rows, media_dir, conv_tag)
+    finally:
+        router.close()
+        copier.close()
+
+    if copier.manifest:
+        acc_out.mkdir(parents=True, exist_ok=True)
+        (acc_out / "media-manifest.json").write_text(
+            json.dumps(copier.manifest, ensure_ascii=False, indent=2),
+            encoding="utf-8")
+
+    stats = {}
+    for h, (out_csv, _, _) in targets.items():
+        if parquet is None:
+            if out_csv not in router.counts:
+                router.write(out_csv, [], "")    # header-only, as before
+                router.close()
+            elif len(router.slices[out_csv]) > 1:
+                resort_csv(out_csv)
+                router.slices[out_csv] = {"sorted"}
+        stats[h] = (counts[h], media[h])
+    return stats
 
 MEDIA_MAP = {3: "Img",   # image
              34: "Audio", # voice
              43: "Video"} # video
 
-def copy_media(account_root: Path, rows, dest_dir: Path):
-    copied = 0
-    for _, _, mtype, _, mid, _ in rows:
-        sub = MEDIA_MAP.get(mtype)
-        if not sub:
-            continue
-        src_dir = account_root / sub
-        for ext in src_dir.glob(f"{mid}*"):
-            dest_dir.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(ext, dest_dir / ext.name)
-            copied += 1
-    return copied
+MEDIA_WORKERS = 8      # media copies are I/O-bound
+MEDIA_IN_FLIGHT = 4 * MEDIA_WORKERS   # scheduled copies before copy() waits
+MEDIA_MODES = ("copy", "hardlink", "reflink")
+FICLONE = 0x40049409   # Linux ioctl: share extents (btrfs, xfs, bcachefs …)
+
+class MediaIndex:
+    """
+    Sorted file names of each media directory, listed once per account.
+    lookup() is the old `src_dir.glob(f"{mid}*")` as a bisect on that list.
+    """
+
+    def __init__(self, account_root: Path):
+        self.account_root = account_root
+        self.names = {}                # sub-dir -> sorted file names
+
+    def _listing(self, sub: str):
+        if sub not in self.names:
+            try:
+                with os.scandir(self.account_root / sub) as it:
+                    self.names[sub] = sorted(
+                        e.name for e in it
+                        if e.is_file())
+            except OSError:            # no such media directory
+                self.names[sub] = []
+        return self.names[sub]
+
+    def lookup(self, sub: str, mid):
+        names = self._listing(sub)
+        prefix = str(mid)
+        i = bisect.bisect_left(names, prefix)
+        while i < len(names) and names[i].startswith(prefix):
+            yield self.account_root / sub / names[i]
+            i += 1
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def reflink(src: Path, dest: Path):
+    """Copy-on-write clone of *src*; raises OSError where unsupported"""
+    if sys.platform == "darwin":       # APFS: clonefile(2), keeps metadata
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dest), 0):
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(src))
+        return
+    import fcntl                       # POSIX only
+    with src.open("rb") as fin, dest.open("wb") as fout:
+        fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+    shutil.copystat(src, dest)
+
+def store_blob(src: Path, store: Path, mode: str) -> tuple:
+    """
+    Put *src* into the content-addressed *store* (store/ab/abcdef…) by
+    hardlink or reflink, falling back to a copy where the filesystem
+    refuses.  Identical content is stored once.  Returns the SHA-256 and
+    whether the blob had to be copied instead.
+    """
+    digest = file_sha256(src)
+    blob = store / digest[:2] / digest
+    copied = False
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f"{digest}.{threading.get_ident()}.tmp")
+        try:
+            if mode == "hardlink":
+                os.link(src, tmp)
+            else:
+                reflink(src, tmp)
+        except (OSError, ImportError):  # cross-device, no CoW support …
+            shutil.copy2(src, tmp)
+            copied = True
+        os.replace(tmp, blob)
+    return digest, copied
+
+class MediaCopier:
+    """
+    Copy a conversation's media through a shared index and thread pool.
+    At most *in_flight* copies are scheduled at once: copy() waits for the
+    oldest ones beyond that, so a failure surfaces with the conversation
+    that caused it and memory stays flat over a whole account.  Blobs that
+    had to be copied instead of linked are marked in the manifest
+    ("fallback": "copy") and reported once.
+    """
+
+    def __init__(self, account_root: Path, workers=MEDIA_WORKERS,
+                 mode="copy", store=None, in_flight=MEDIA_IN_FLIGHT):
+        if mode != "copy" and store is None:
+            raise ValueError(f"media mode {mode!r} needs a blob store")
+        self.index = MediaIndex(account_root)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.mode = mode
+        self.store = store
+        self.in_flight = in_flight
+        self.pending = deque()         # (future, (conv, MesLocalID, name) | None)
+        self.manifest = {}             # conv -> {MesLocalID: [{file, blob}]}
+        self.fell_back = False
+
+    def copy(self, rows, dest_dir: Path, conv=None):
+        """Schedule the media of *rows* for copying; returns the file count"""
+        copied = 0
+        for _, _, mtype, _, mid, _ in rows:
+            sub = MEDIA_MAP.get(mtype)
+            if not sub:
+                continue
+            for src in self.index.lookup(sub, mid):
+                if self.mode != "copy":
+                    fut = self.pool.submit(store_blob, src, self.store,
+                                           self.mode)
+                    link = (conv or dest_dir.name, mid, src.name)
+                else:
+                    if not copied:
+                        dest_dir.mkdir(parents=True, exist_ok=True)
+                    fut = self.pool.submit(shutil.copy2, src,
+                                           dest_dir / src.name)
+                    link = None
+                self.pending.append((fut, link))
+                copied += 1
+                self._settle(self.in_flight)
+        return copied
+
+    def _settle(self, limit):
+        """Wait for the oldest copies until at most *limit* are pending"""
+        while len(self.pending) > limit:
+            fut, link = self.pending.popleft()
+            result = fut.result()      # re-raises a failed copy
+            if link is not None:
+                conv, mid, name = link
+                digest, copied = result
+                entry = {"file": name,
+                         "blob": f"{self.store.name}/{digest[:2]}/{digest}"}
+                if copied:
+                    entry["fallback"] = "copy"
+                    if not self.fell_back:
+                        self.fell_back = True
+                        click.echo(f"⚠️  --media {self.mode} unsupported here – "
+                                   "copying instead (see media-manifest.json)",
+                                   err=True)
+                self.manifest.setdefault(conv, {}).setdefault(
+                    str(mid), []).append(entry)
+
+    def close(self):
+        """Wait for every scheduled copy (re-raising the first failure)"""
+        try:
+            self._settle(0)
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 # ---------- CLI -------------------------------------------------------------
 
@@ -82,19 +349,21 @@ def copy_media(account_root: Path, rows, dest_dir: Path):
               type=click.Path(path_type=Path, exists=True, readable=True),
               required=True,
               help="Path to the un-encrypted iTunes/Finder backup root")
+@click.option("--rediscover", is_flag=True,
+              help="Ignore the cached account list and search the backup again")
 @click.pass_context
-def cli(ctx, backup_root):
+def cli(ctx, backup_root, rediscover):
     """WeChat conversation dumper for *iOS* backups."""
-    ctx.obj = {"backup_root": backup_root}
+    ctx.obj = {"backup_root": backup_root, "rediscover": rediscover}
 
 @cli.command("list")
 @click.pass_context
 def list_conversations(ctx):
     """Show every account and its conversations"""
-    for acc in find_accounts(ctx.obj["backup_root"]):
+    for acc in find_accounts(ctx.obj["backup_root"], ctx.obj["rediscover"]):
         contact_db = acc / "DB" / "WCDB_Contact.sqlite"
         click.echo(f"\n📱 Account: {acc.name}")
-        for usr, nick, alias in list_contacts(contact_db):
+        for _, usr, nick, alias in list_contacts(contact_db):
             click.echo(f"  • {usr:<35} | {nick or ''} {alias or ''}")
 
 @cli.command("export-all")
@@ -102,29 +371,46 @@ def list_conversations(ctx):
               type=click.Path(path_type=Path, writable=True),
               default="wechat_export",
               help="Destination folder (default: ./wechat_export)")
+@click.option("--media", "media_mode",
+              type=click.Choice(MEDIA_MODES), default="copy", show_default=True,
+              help="copy: media/<conversation>/ per chat;  hardlink/reflink: "
+                   "deduplicated blobs in OUT/blobs/ + media-manifest.json "
+                   "(hardlinks share the backup's inodes – don't edit them; "
+                   "reflink needs Linux CoW or macOS APFS, else blobs are "
+                   "copied and marked in the manifest)")
+@click.option("--format", "out_format",
+              type=click.Choice(["csv", "parquet"]), default="csv",
+              show_default=True,
+              help="csv: one file per contact;  parquet: OUT/messages/ "
+                   "partitioned by account and chat kind (needs pyarrow)")
 @click.pass_context
-def export_all(ctx, out_dir):
+def export_all(ctx, out_dir, media_mode, out_format):
     """Dump every conversation (+media) into OUT/"""
     backup_root = ctx.obj["backup_root"]
     out_dir = Path(out_dir)
-    for acc in find_accounts(backup_root):
-        acc_id = acc.name
-        acc_out = out_dir / acc_id
-        db_dir = acc / "DB"
-        slices = slice_dbs(db_dir)
-        contact_db = db_dir / "WCDB_Contact.sqlite"
-
-        click.echo(f"\n🔍 Processing account {acc_id} …")
-        for usr, nick, alias in list_contacts(contact_db):
-            h = md5_hex(usr)
-            conv_tag = nick or alias or usr
-            click.echo(f"   • {conv_tag} … ", nl=False)
-
-            rows = export_messages(slices, h,
-                                   acc_out / f"{conv_tag}.csv")
-            media_count = copy_media(acc, rows,
-                                     acc_out / "media" / conv_tag)
-            click.echo(f"{len(rows):5d} msgs, {media_count:4d} media")
+    store = out_dir / "blobs" if media_mode != "copy" else None
+    parquet = None
+    if out_format == "parquet":
+        try:
+            parquet = ParquetWriter(out_dir / "messages")
+        except RuntimeError as exc:    # pyarrow missing
+            raise click.UsageError(str(exc))
+    try:
+        for acc in find_accounts(backup_root, ctx.obj["rediscover"]):
+            acc_id = acc.name
+            acc_out = out_dir / acc_id
+            contact_db = acc / "DB" / "WCDB_Contact.sqlite"
+
+            click.echo(f"\n🔍 Processing account {acc_id} …")
+            contacts = list_contacts(contact_db)
+            stats = export_account(acc, acc_out, contacts, media_mode, store,
+                                   parquet)
+            for h, conv_tag in conversation_tags(contacts).items():
+                n_rows, media_count = stats[h]
+                click.echo(f"   • {conv_tag} … {n_rows:5d} msgs, {media_count:4d} media")
+    finally:
+        if parquet is not None:
+            parquet.close()
 
     click.echo(f"\n✅ Finished. Outputs in {out_dir.resolve()}")
 
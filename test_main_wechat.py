@@ -0,0 +1,90 @@
+import csv
+import sqlite3
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from main_wechat import cli
+from wechat_utils._helpers import md5_hex
+from wechat_utils.mockgen import build_container
+
+
+def chat_rows(db_dir: Path, h: str):
+    """(CreateTime, Des, Type, Message, MesLocalID) of one chat over every slice."""
+    rows = []
+    for db in sorted(db_dir.glob("message_*.sqlite")):
+        with sqlite3.connect(db) as con:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE name=?",
+                           (f"Chat_{h}",)).fetchone():
+                rows += con.execute(f"SELECT CreateTime,Des,Type,Message,MesLocalID "
+                                    f"FROM Chat_{h}").fetchall()
+    return rows
+
+
+def test_export_all_one_csv_per_contact(tmp_path: Path):
+    build_container(tmp_path / "backup", 1, 4, 6, 2, fast=True)
+    acc = next((tmp_path / "backup").rglob("WCDB_Contact.sqlite")).parent.parent
+    with sqlite3.connect(acc / "DB" / "WCDB_Contact.sqlite") as con:
+        users = [usr for (usr,) in con.execute("SELECT UsrName FROM Friend ORDER BY UsrName")]
+        con.executemany("UPDATE Friend SET NickName='Same' WHERE UsrName=?",
+                        [(usr,) for usr in users[:2]])
+        names = {usr: nick or alias or usr
+                 for usr, nick, alias in con.execute("SELECT UsrName, NickName, Alias FROM Friend")}
+
+    out = tmp_path / "out"
+    result = CliRunner().invoke(cli, ["--backup", str(tmp_path / "backup"),
+                                      "export-all", "--out", str(out)])
+    assert result.exit_code == 0, result.output
+
+    files = sorted(p.name for p in (out / acc.name).glob("*.csv"))
+    assert len(files) == len(users)
+    assert "Same.csv" not in files
+    for usr in users:
+        h = md5_hex(usr)
+        name = f"Same_{h[:8]}.csv" if usr in users[:2] else f"{names[usr]}.csv"
+        with (out / acc.name / name).open(newline="", encoding="utf-8") as fh:
+            header, *rows = list(csv.reader(fh))
+        expected = chat_rows(acc / "DB", h)
+        assert header[0] == "CreateTime" and len(rows) == len(expected)
+        assert sorted((int(r[0]), int(r[4])) for r in rows) == \
+            sorted((r[0], r[4]) for r in expected)
+        assert [int(r[0]) for r in rows] == sorted(int(r[0]) for r in rows)
+
+
+def test_media_copier_bounds_pending_and_fails_early(tmp_path: Path):
+    import pytest
+    from main_wechat import MediaCopier
+    (tmp_path / "acc" / "Img").mkdir(parents=True)
+    for mid in range(1, 6):
+        (tmp_path / "acc" / "Img" / f"{mid}.pic").write_bytes(b"x" * mid)
+    rows = [(0, 0, 3, "", mid, 0) for mid in range(1, 6)]
+    dest = tmp_path / "media"
+    with MediaCopier(tmp_path / "acc", in_flight=2) as copier:
+        assert copier.copy(rows, dest) == 5 and len(copier.pending) <= 2
+    assert sorted(p.name for p in dest.iterdir()) == [f"{m}.pic" for m in range(1, 6)]
+
+    (tmp_path / "bad").mkdir()
+    (tmp_path / "bad" / "1.pic").symlink_to(tmp_path / "missing" / "1.pic")
+    copier = MediaCopier(tmp_path / "acc", in_flight=1)
+    copier.copy(rows[:1], tmp_path / "bad")
+    with pytest.raises(OSError):
+        copier.copy(rows[1:2], tmp_path / "bad")        # the first failure, not close()
+    copier.close()
+
+
+def test_reflink_fallback_is_reported_once(tmp_path: Path, monkeypatch, capsys):
+    import main_wechat
+    (tmp_path / "acc" / "Img").mkdir(parents=True)
+    for mid in (1, 2):
+        (tmp_path / "acc" / "Img" / f"{mid}.pic").write_bytes(b"x" * mid)
+
+    def no_cow(src, dest):
+        raise OSError(95, "Operation not supported")
+
+    monkeypatch.setattr(main_wechat, "reflink", no_cow)
+    with main_wechat.MediaCopier(tmp_path / "acc", mode="reflink",
+                                 store=tmp_path / "blobs") as copier:
+        copier.copy([(0, 0, 3, "", 1, 0), (0, 0, 3, "", 2, 0)], tmp_path / "m", "conv")
+    entries = [e for mids in copier.manifest["conv"].values() for e in mids]
+    assert len(entries) == 2 and all(e["fallback"] == "copy" for e in entries)
+    assert capsys.readouterr().err.count("copying instead") == 1
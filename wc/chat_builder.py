@@ -1,9 +1,10 @@
 # chat_builder.py
 from __future__ import annotations
+from operator import attrgetter
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Union
 from pydantic import BaseModel
-from wc_db import WeChatSQLite
+from wc_db import ConnectionPool, RawMessage, WeChatSQLite
 
 
 class Message(BaseModel):
@@ -23,28 +24,87 @@ class Chat(BaseModel):
         self.messages.append(msg)
 
 
-def build_chats(db_folder: Path) -> Dict[str, Chat]:
-    db = WeChatSQLite(db_folder)
+# ---------- compact bulk-load records (no per-row validation) ----------
+class MessageRecord:
+    """
+    Same fields as Message, in __slots__ – what build_chats loads by default.
+    *text* may be a str or the RawMessage itself: its body is then only
+    inflated and decoded when .text is first read.
+    """
+    __slots__ = ("msg_id", "timestamp", "is_outgoing", "mtype", "_text")
+    FIELDS = ("msg_id", "timestamp", "is_outgoing", "mtype", "text")
 
-    # 1) basic roster --------------------------------------------------
-    chats: Dict[str, Chat] = {cid: Chat(chat_id=cid, members=mem)
-                              for cid, mem in db.load_contacts().items()}
+    def __init__(self, msg_id, timestamp, is_outgoing, mtype,
+                 text: Union[str, RawMessage]):
+        self.msg_id = msg_id
+        self.timestamp = timestamp
+        self.is_outgoing = is_outgoing
+        self.mtype = mtype
+        self._text = text
 
-    # 2) messages (text only for brevity) ------------------------------
-    for cid, raw in db.messages(types=(1,)):
-        chat = chats.setdefault(cid, Chat(chat_id=cid))
-        chat.add(Message(
-            msg_id=raw["mid"],
-            timestamp=raw["ts"],
-            is_outgoing=bool(raw["sender_flag"]),
-            mtype=raw["mtype"],
-            text=raw["body"].decode("utf-8", "replace").replace("\x02", "")
-        ))
+    @property
+    def text(self) -> str:
+        if isinstance(self._text, RawMessage):
+            self._text = self._text.text        # drops the row and its blob
+        return self._text
+
+    def as_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+
+class ChatRecord:
+    """Same fields as Chat; to_model() validates it into the pydantic Chat."""
+    __slots__ = ("chat_id", "members", "messages")
+
+    def __init__(self, chat_id: str, members: Optional[List[str]] = None):
+        self.chat_id = chat_id
+        self.members = list(members) if members is not None else []   # cache is shared
+        self.messages: List[MessageRecord] = []
+
+    def add(self, msg: MessageRecord):
+        self.messages.append(msg)
+
+    def to_model(self) -> Chat:
+        return Chat(chat_id=self.chat_id, members=self.members,
+                    messages=[Message(**m.as_dict()) for m in self.messages])
+
+
+def build_chats(db_folder: Path, bodies: bool = True,
+                pool: Optional[ConnectionPool] = None,
+                validate: bool = False) -> Dict[str, Union[ChatRecord, Chat]]:
+    """
+    Bulk-loads ChatRecord/MessageRecord objects; validate=True returns
+    pydantic Chat models instead (validation runs once per chat, at the end).
+    bodies=False skips the Message column (text="") – for counts/timelines.
+    Long-running callers pass a shared *pool* so handles survive between
+    calls; otherwise they are closed before returning.
+    """
+    columns = None if bodies else ("mid", "sender_flag", "ts", "mtype")
+    with WeChatSQLite(db_folder, pool) as db:
+        # 1) basic roster ----------------------------------------------
+        chats: Dict[str, ChatRecord] = {cid: ChatRecord(cid, mem)
+                                        for cid, mem in db.load_contacts().items()}
+
+        # 2) messages (text only for brevity) --------------------------
+        for cid, raw in db.messages(types=(1,), columns=columns):
+            chat = chats.get(cid)
+            if chat is None:
+                chat = chats[cid] = ChatRecord(cid)
+            chat.add(MessageRecord(
+                raw.mid,
+                raw.ts,
+                bool(raw.sender_flag),
+                raw.mtype,
+                raw                            # body decoded on first .text
+            ))
 
     # 3) final tidy – sort by time ------------------------------------
+    by_time = attrgetter("timestamp")
     for c in chats.values():
-        c.messages.sort(key=lambda m: m.timestamp)
+        c.messages.sort(key=by_time)
 
+    if validate:
+        return {cid: c.to_model() for cid, c in chats.items()}
     return chats
 
 
@@ -55,5 +115,5 @@ if __name__ == "__main__":
     result = build_chats(root)
     print(f"Loaded {len(result)} chats.")
     # Optional: dump to pretty JSON
-    # print(json.dumps({k: v.dict() for k, v in result.items()},
+    # print(json.dumps({k: v.to_model().dict() for k, v in result.items()},
     #                 ensure_ascii=False, indent=2))
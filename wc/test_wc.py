@@ -0,0 +1,117 @@
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from chat_builder import build_chats
+
+U1 = hashlib.md5(b"u1").hexdigest()
+ROSTER = '<RoomData><Member userName="u1"/><Member userName="u2"/></RoomData>'
+
+
+def make_backup(root: Path, shards: int = 2) -> Path:
+    """DB/ folder: a Friend roster and Chat_<md5(u1)> in every shard."""
+    db_dir = root / "DB"
+    db_dir.mkdir(parents=True)
+    con = sqlite3.connect(db_dir / "WCDB_Contact.sqlite")
+    con.execute("CREATE TABLE Friend(userName TEXT PRIMARY KEY, dbContactChatRoom BLOB)")
+    con.executemany("INSERT INTO Friend VALUES (?,?)",
+                    [("a@chatroom", ROSTER.encode()), ("u1", None)])
+    con.commit(); con.close()
+    for n in range(1, shards + 1):
+        con = sqlite3.connect(db_dir / f"message_{n}.sqlite")
+        con.execute(f"CREATE TABLE Chat_{U1}(MesLocalID INTEGER PRIMARY KEY, MesSvrID INTEGER, "
+                    "CreateTime INTEGER, Message BLOB, Status INTEGER, ImgStatus INTEGER, "
+                    "Type INTEGER, Des INTEGER)")
+        con.executemany(f"INSERT INTO Chat_{U1}(MesSvrID,CreateTime,Message,Status,ImgStatus,Type,Des) "
+                        "VALUES (?,?,?,0,0,1,?)",
+                        [(n * 100 + i, 1_700_000_000 + n * 10 + i, f"m{n}-{i}".encode(), i % 2)
+                         for i in range(3)])
+        con.commit(); con.close()
+    return db_dir
+
+
+def test_build_chats_members_not_shared(tmp_path: Path):
+    db_dir = make_backup(tmp_path)
+    build_chats(db_dir)["a@chatroom"].members.append("INJECTED")
+    assert build_chats(db_dir)["a@chatroom"].members == ["u1", "u2"]
+
+
+def test_build_chats_decodes_bodies_on_access(tmp_path: Path, monkeypatch):
+    from wc_db import RawMessage
+    db_dir = make_backup(tmp_path)
+    decoded = []
+    text = RawMessage.text.fget
+    monkeypatch.setattr(RawMessage, "text",
+                        property(lambda raw: decoded.append(raw.mid) or text(raw)))
+    chat = build_chats(db_dir)[U1]
+    assert decoded == []
+    assert [m.text for m in chat.messages] == [f"m{n}-{i}" for n in (1, 2) for i in range(3)]
+    chat.messages[0].text
+    assert len(decoded) == 6
+    assert chat.to_model().messages[0].text == "m1-0"
+
+
+FD_DIR = "/dev/fd"          # Linux, macOS and the BSDs list open descriptors here
+needs_fd_dir = pytest.mark.skipif(not os.path.isdir(FD_DIR),
+                                  reason=f"no {FD_DIR} on this platform")
+
+
+def open_fds() -> int:
+    return len(os.listdir(FD_DIR))
+
+
+@needs_fd_dir
+def test_build_chats_does_not_leak_descriptors(tmp_path: Path):
+    db_dir = make_backup(tmp_path)
+    build_chats(db_dir)
+    before = open_fds()
+    for _ in range(20):
+        build_chats(db_dir)
+    assert open_fds() == before
+
+
+@needs_fd_dir
+def test_load_wechat_backup_closes_shards_on_error(tmp_path: Path):
+    from wc_backup_parser import load_wechat_backup
+    db_dir = make_backup(tmp_path)
+    with sqlite3.connect(db_dir / "message_2.sqlite") as con:
+        con.execute("CREATE TABLE Chat_broken(MesLocalID INTEGER PRIMARY KEY)")
+    before = open_fds()
+    for _ in range(5):
+        with pytest.raises(sqlite3.OperationalError):
+            load_wechat_backup(db_dir)
+    assert open_fds() == before
+
+
+def test_messages_projection_never_reads_body(tmp_path: Path):
+    from wc_db import ConnectionPool, WeChatSQLite
+    db_dir = make_backup(tmp_path)
+    statements = []
+
+    class TracingPool(ConnectionPool):
+        def get(self, path, text_factory=str):
+            db = super().get(path, text_factory)
+            db.set_trace_callback(statements.append)
+            return db
+
+    with WeChatSQLite(db_dir, TracingPool()) as db:
+        rows = list(db.messages(columns=("mid", "ts")))
+    assert len(rows) == 6
+    assert all(raw.body is None and raw.text == "" for _, raw in rows)
+    selects = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")
+               and "Chat_" in sql]
+    assert selects and not any("Message" in sql for sql in selects)
+
+
+def test_validate_equals_to_model(tmp_path: Path):
+    from wc_backup_parser import load_wechat_backup
+    db_dir = make_backup(tmp_path)
+    for load in (build_chats, load_wechat_backup):
+        records = load(db_dir)
+        models = load(db_dir, validate=True)
+        assert models.keys() == records.keys()
+        assert all(models[cid] == rec.to_model() for cid, rec in records.items())
+        assert len(models[U1].messages) == 6
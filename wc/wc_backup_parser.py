@@ -1,9 +1,13 @@
 # wechat_backup_parser.py
 from __future__ import annotations
-import sqlite3, zlib, xml.etree.ElementTree as ET
+import sqlite3, zlib
+from contextlib import ExitStack, closing
+from operator import attrgetter
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Union
 from pydantic import BaseModel
+from wc_chatroom import parse_members
+from wechat_utils.catalog import dedup_key_sql, merge_dedup, shard_chain
 
 
 # ---------- Pydantic models ----------
@@ -23,6 +27,39 @@ class Chat(BaseModel):
         self.messages.append(m)
 
 
+# ---------- Compact bulk-load records ----------
+class MessageRecord:
+    """Message's fields in __slots__ – no validation, ~1/5 of the memory."""
+    __slots__ = ("msg_id", "sender", "timestamp", "mtype", "body")
+
+    def __init__(self, msg_id, sender, timestamp, mtype, body):
+        self.msg_id = msg_id
+        self.sender = sender
+        self.timestamp = timestamp
+        self.mtype = mtype
+        self.body = body
+
+    def as_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self.__slots__}
+
+
+class ChatRecord:
+    """Chat's fields in __slots__; to_model() validates into a Chat."""
+    __slots__ = ("chat_id", "members", "messages")
+
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+        self.members: List[str] = []
+        self.messages: List[MessageRecord] = []
+
+    def add(self, m: MessageRecord) -> None:
+        self.messages.append(m)
+
+    def to_model(self) -> Chat:
+        return Chat(chat_id=self.chat_id, members=self.members,
+                    messages=[Message(**m.as_dict()) for m in self.messages])
+
+
 # ---------- Helpers ----------
 def _maybe_decompress(blob: bytes) -> bytes:
     """WeChat compresses long text bodies with zlib (0x78 0x9C header)."""
@@ -38,70 +75,85 @@ def _decode_text(b: bytes) -> str:
     return _maybe_decompress(b).decode("utf-8", errors="replace").replace("\x02", "")
 
 
-def _parse_chatroom_xml(xml_blob: Optional[bytes]) -> List[str]:
-    if not xml_blob:
-        return []
-    try:
-        root = ET.fromstring(xml_blob.decode("utf-8", "ignore"))
-        return [m.get("userName") for m in root.findall(".//Member") if m.get("userName")]
-    except ET.ParseError:
-        return []
-
-
 # ---------- Core extractor ----------
-def load_wechat_backup(db_folder: Path) -> Dict[str, Chat]:
+def load_wechat_backup(db_folder: Path,
+                       validate: bool = False) -> Dict[str, Union[ChatRecord, Chat]]:
     """
     :param db_folder: path that contains WCDB_Contact.sqlite and message_*.sqlite
                       e.g. .../Documents/<md5(wxid)>/DB
+    :param validate: return pydantic Chat models (validated once, at the end)
+                     instead of the compact ChatRecord/MessageRecord objects
     :return: dict keyed by chat_id
     """
-    chats: Dict[str, Chat] = {}
+    chats: Dict[str, ChatRecord] = {}
 
     # 1) Contacts & group membership -----------------
-    contact_db = sqlite3.connect(db_folder / "WCDB_Contact.sqlite")
-    contact_db.execute("PRAGMA key=''")           # empty key for backups
-    for row in contact_db.execute(
-            "SELECT userName, dbContactChatRoom FROM Friend"):
-        uid, room_xml = row
-        chat = chats.setdefault(uid, Chat(chat_id=uid))
-        if uid.endswith("@chatroom"):
-            chat.members = _parse_chatroom_xml(room_xml)
-
-    # 2) Iterate every shard -------------------------
-    for shard_path in db_folder.glob("message_*.sqlite"):
-        db = sqlite3.connect(shard_path)
-        db.text_factory = bytes                 # raw blobs
-        db.execute("PRAGMA key=''")
-
-        # list all Chat_ tables in this shard
-        for (tbl,) in db.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'Chat_%'"):
-            chat_id = tbl[5:]                   # strip "Chat_"
-            chat = chats.setdefault(chat_id, Chat(chat_id=chat_id))
+    with closing(sqlite3.connect(db_folder / "WCDB_Contact.sqlite")) as contact_db:
+        contact_db.execute("PRAGMA key=''")       # empty key for backups
+        for row in contact_db.execute(
+                "SELECT userName, dbContactChatRoom FROM Friend"):
+            uid, room_xml = row
+            chat = chats.get(uid)
+            if chat is None:
+                chat = chats[uid] = ChatRecord(uid)
+            if uid.endswith("@chatroom"):
+                chat.members = parse_members(room_xml)
+
+    with ExitStack() as shards:                 # every shard closed on exit
+        # 2) Every shard, in shard_chain order (MM.sqlite first) -------
+        layout: Dict[str, List[tuple]] = {}     # chat_id → [(db, table), …]
+        for shard_path in shard_chain(db_folder):
+            db = shards.enter_context(closing(sqlite3.connect(shard_path)))
+            db.text_factory = bytes             # raw blobs
+            db.execute("PRAGMA key=''")
+
+            # list all Chat_ tables in this shard
+            for (tbl,) in db.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' "
+                    "AND name LIKE 'Chat_%' AND name NOT LIKE 'ChatExt2_%'").fetchall():
+                tbl = tbl.decode()              # bytes under text_factory
+                layout.setdefault(tbl[5:], []).append((db, tbl))   # strip "Chat_"
+
+        # 3) Messages per chat; a chat in several shards is merged by time
+        #    and a message repeated across shards is kept once -------
+        cols = ("MesLocalID, MesSvrID, CreateTime, Message,"
+                "       Status, ImgStatus, Type, Des ")
+        for chat_id, tables in layout.items():
+            chat = chats.get(chat_id)
+            if chat is None:
+                chat = chats[chat_id] = ChatRecord(chat_id)
 
             # pull messages (you can window / paginate here)
-            for mid, svr, ts, body, status, img, mtype, des in db.execute(
-                    f"SELECT MesLocalID, MesSvrID, CreateTime, Message,"
-                    f"       Status, ImgStatus, Type, Des "
-                    f"FROM {tbl} ORDER BY MesLocalID"):
+            if len(tables) == 1:
+                db, tbl = tables[0]
+                rows = db.execute(f"SELECT {cols} FROM {tbl} ORDER BY MesLocalID")
+            else:
+                rows = merge_dedup([
+                    db.execute(f"SELECT {cols}, {dedup_key_sql(db, tbl)} "
+                               f"FROM {tbl} ORDER BY CreateTime, MesLocalID")
+                    for db, tbl in tables
+                ], ts_index=2, key_index=8)
+            for mid, svr, ts, body, status, img, mtype, des, *_ in rows:
                 if mtype == 1:
                     body_text = _decode_text(body)
                 else:
                     body_text = body.hex()      # keep non-text as hex
 
-                msg = Message(
-                    msg_id=svr or mid,
-                    sender=chat_id if des else "me",  # quick heuristic
-                    timestamp=ts,
-                    mtype=mtype,
-                    body=body_text
-                )
-                chat.add(msg)
+                chat.add(MessageRecord(
+                    svr or mid,
+                    chat_id if des else "me",  # quick heuristic
+                    ts,
+                    mtype,
+                    body_text
+                ))
 
-    # 3) Sort messages per chat (optional)
+    # 4) Sort messages per chat (optional)
+    by_time = attrgetter("timestamp")
     for c in chats.values():
-        c.messages.sort(key=lambda m: m.timestamp)
+        c.messages.sort(key=by_time)
 
+    if validate:
+        return {cid: c.to_model() for cid, c in chats.items()}
     return chats
 
 
@@ -114,4 +166,4 @@ if __name__ == "__main__":
     for cid, chat in data.items():
         print(f"{cid} – {len(chat.members)} members – {len(chat.messages)} msgs")
     # dump to JSON if wanted
-    # Path("wechat_backup.json").write_text(json.dumps(data, default=lambda o: o.dict(), ensure_ascii=False, indent=2))
+    # Path("wechat_backup.json").write_text(json.dumps(data, default=lambda o: o.as_dict(), ensure_ascii=False, indent=2))
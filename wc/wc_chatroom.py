@@ -0,0 +1,53 @@
+# wc_chatroom.py
+from __future__ import annotations
+import hashlib, re, xml.etree.ElementTree as ET
+from collections import OrderedDict
+from html import unescape
+from typing import List, Optional, Tuple, Union
+
+CACHE_SIZE = 4096              # distinct rosters kept in memory
+
+_MEMBER_RE = re.compile(rb"""<Member\b[^>]*?\buserName\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_cache: "OrderedDict[bytes, Tuple[str, ...]]" = OrderedDict()
+
+
+def _slow_parse(xml_blob: bytes) -> Tuple[str, ...]:
+    """Full ElementTree parse – for comments, CDATA, doctypes …"""
+    try:
+        root = ET.fromstring(xml_blob.decode("utf-8", "ignore"))
+    except ET.ParseError:
+        return ()
+    return tuple(m.get("userName") for m in root.findall(".//Member") if m.get("userName"))
+
+
+def _fast_parse(xml_blob: bytes) -> Tuple[str, ...]:
+    """Regex scan of <Member userName="…"> attributes, in document order."""
+    names = []
+    for dq, sq in _MEMBER_RE.findall(xml_blob):
+        name = (dq or sq).decode("utf-8", "ignore")
+        if name:
+            names.append(unescape(name) if "&" in name else name)
+    return tuple(names)
+
+
+def parse_members(xml_blob: Optional[Union[bytes, str]]) -> List[str]:
+    """
+    Member wxids of a dbContactChatRoom roster.  Memoised on the blob's
+    hash, so an unchanged roster is parsed once per process; plain rosters
+    take the regex path, anything with <! markup the full XML parser.
+    The regex path is lenient: a truncated roster still yields its members.
+    """
+    if not xml_blob:
+        return []
+    if isinstance(xml_blob, str):
+        xml_blob = xml_blob.encode("utf-8")
+    key = hashlib.blake2b(xml_blob, digest_size=16).digest()
+    members = _cache.get(key)
+    if members is None:
+        members = _slow_parse(xml_blob) if b"<!" in xml_blob else _fast_parse(xml_blob)
+        _cache[key] = members
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return list(members)
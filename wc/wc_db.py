@@ -1,8 +1,11 @@
 # wechat_db.py
 from __future__ import annotations
-import sqlite3, zlib, xml.etree.ElementTree as ET
+import sqlite3, zlib
 from pathlib import Path
-from typing import Dict, List, Iterable, Iterator, Tuple, Optional
+from typing import Callable, Dict, List, Iterable, Iterator, Tuple, Optional
+from wc_chatroom import parse_members
+from wechat_utils.catalog import dedup_key_sql, merge_dedup, shard_chain
+from wechat_utils.contacts import cached
 
 
 def _maybe_decompress(blob: bytes) -> bytes:
@@ -15,57 +18,179 @@ def _maybe_decompress(blob: bytes) -> bytes:
     return blob
 
 
-def _parse_chatroom_xml(xml_blob: Optional[bytes]) -> List[str]:
-    if not xml_blob:
-        return []
-    try:
-        root = ET.fromstring(xml_blob.decode("utf-8", "ignore"))
-        return [m.get("userName") for m in root.findall(".//Member") if m.get("userName")]
-    except ET.ParseError:
-        return []
+# record field -> Chat_<id> column
+MESSAGE_COLUMNS = {"mid": "MesLocalID", "sender_flag": "Des",
+                   "ts": "CreateTime", "mtype": "Type", "body": "Message"}
+
+
+class RawMessage:
+    """
+    One Chat_<id> row, kept as fetched.  The body blob is only inflated
+    (.body) and decoded (.text) when asked for – and then just once.
+    Fields left out of a column projection are None.
+    """
+    __slots__ = ("mid", "sender_flag", "ts", "mtype", "_blob", "_body", "_text")
+
+    def __init__(self, mid=None, sender_flag=None, ts=None, mtype=None, blob=None):
+        self.mid = mid
+        self.sender_flag = sender_flag
+        self.ts = ts
+        self.mtype = mtype
+        self._blob = blob
+        self._body = None
+        self._text = None
+
+    @property
+    def body(self) -> Optional[bytes]:
+        """Message bytes, zlib-inflated if needed."""
+        if self._body is None and self._blob is not None:
+            self._body = _maybe_decompress(self._blob)
+        return self._body
+
+    @property
+    def text(self) -> str:
+        """Body as str (invalid UTF-8 replaced, \\x02 markers stripped)."""
+        if self._text is None:
+            body = self.body
+            self._text = (body.decode("utf-8", "replace").replace("\x02", "")
+                          if body is not None else "")
+        return self._text
+
+    def __getitem__(self, key: str):              # old dict-style access
+        if key not in MESSAGE_COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+MMAP_SIZE = 256 << 20          # bytes of each DB file mapped into memory
+CACHE_KIB = 64 << 10           # page cache per handle (PRAGMA cache_size=-KiB)
+
+
+class ConnectionPool:
+    """
+    One read-only/immutable handle per DB file, reused across calls and
+    closed deterministically by close() / the with-block.  A handle whose
+    file changed size or mtime is reopened, since immutable=1 would
+    otherwise serve stale pages.  Not thread-safe: one pool per thread.
+    """
+    def __init__(self, mmap_size: int = MMAP_SIZE, cache_kib: int = CACHE_KIB):
+        self.mmap_size = mmap_size
+        self.cache_kib = cache_kib
+        self._handles: Dict[Path, Tuple[Tuple[int, int], sqlite3.Connection]] = {}
+
+    def get(self, path: Path, text_factory: Callable = str) -> sqlite3.Connection:
+        path = Path(path).resolve()
+        st = path.stat()
+        stamp = (st.st_size, st.st_mtime_ns)
+        entry = self._handles.get(path)
+        if entry is not None and entry[0] != stamp:
+            entry[1].close()
+            entry = None
+        if entry is None:
+            db = sqlite3.connect(path.as_uri() + "?mode=ro&immutable=1", uri=True)
+            db.execute("PRAGMA key=''")                 # plain-key backup
+            db.execute(f"PRAGMA mmap_size={self.mmap_size}")
+            db.execute(f"PRAGMA cache_size=-{self.cache_kib}")
+            entry = self._handles[path] = (stamp, db)
+        db = entry[1]
+        db.text_factory = text_factory
+        return db
+
+    def close(self) -> None:
+        for _, db in self._handles.values():
+            db.close()
+        self._handles.clear()
+
+    def __len__(self) -> int:
+        return len(self._handles)
 
 
 class WeChatSQLite:
-    """Low-level helper for *decrypted* WeChat 8.x backup databases."""
-    def __init__(self, db_folder: Path):
+    """
+    Low-level helper for *decrypted* WeChat 8.x backup databases.
+    Handles come from a ConnectionPool; use it as a context manager (or
+    call close()) to release them.  Pass *pool* to share one across folders.
+    """
+    def __init__(self, db_folder: Path, pool: Optional[ConnectionPool] = None):
         self.root = Path(db_folder)
+        self.pool = pool if pool is not None else ConnectionPool()
+        self._own_pool = pool is None
+
+    def close(self) -> None:
+        if self._own_pool:
+            self.pool.close()
+
+    def __enter__(self) -> "WeChatSQLite":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
     # ---------- contacts ----------
     def load_contacts(self) -> Dict[str, List[str]]:
         """Returns {chat_id: [member wxids]}. Plain chats map to []."""
+        contact_db = self.root / "WCDB_Contact.sqlite"
+        return cached(contact_db, "wc_rooms", self._read_contacts)
+
+    def _read_contacts(self, contact_db: Path) -> Dict[str, List[str]]:
         out: Dict[str, List[str]] = {}
-        db = sqlite3.connect(self.root / "WCDB_Contact.sqlite")
-        db.execute("PRAGMA key=''")                     # plain-key backup
+        db = self.pool.get(contact_db)
         for uid, room_xml in db.execute(
                 "SELECT userName, dbContactChatRoom FROM Friend"):
-            out[uid] = _parse_chatroom_xml(room_xml) if uid.endswith("@chatroom") else []
+            out[uid] = parse_members(room_xml) if uid.endswith("@chatroom") else []
         return out
 
     # ---------- messages ----------
     def iter_shards(self) -> Iterable[Path]:
-        """Yields every message_*.sqlite path found under the folder."""
-        return self.root.glob("message_*.sqlite")
+        """MM.sqlite, then message_1 … message_N (catalog.shard_chain order)."""
+        return shard_chain(self.root)
 
     def iter_chat_tables(self, shard_path: Path) -> Iterator[Tuple[str, sqlite3.Connection]]:
         """Yield (chat_id, db_handle) pairs for each Chat_<id> table in a shard."""
-        db = sqlite3.connect(shard_path)
-        db.text_factory = bytes
-        db.execute("PRAGMA key=''")
-        for (tbl,) in db.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'Chat_%'"):
-            yield tbl[5:], db                           # strip "Chat_"
-
-    def messages(self, types: Tuple[int, ...] = (1,)) -> Iterator[Tuple[str, dict]]:
+        db = self.pool.get(shard_path, text_factory=bytes)
+        tables = db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name LIKE 'Chat_%' AND name NOT LIKE 'ChatExt2_%'").fetchall()
+        for (tbl,) in tables:
+            yield tbl.decode()[5:], db                  # bytes (text_factory); strip "Chat_"
+
+    def messages(self, types: Tuple[int, ...] = (1,),
+                 columns: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, RawMessage]]:
         """
-        Yields (chat_id, raw_msg_dict).
+        Yields (chat_id, RawMessage), one chat after another.
 
-        raw_msg_dict has keys:
-            mid, sender_flag (0=rx,1=tx), ts, mtype, body_bytes
+        RawMessage has mid, sender_flag (0=rx,1=tx), ts, mtype and the lazy
+        body / text; raw["mid"] etc. still work.  *columns* restricts the
+        SELECT to those fields (e.g. ("ts",) for timelines) – anything not
+        projected, the body included, is never read from the shard.
+
+        A chat spread over several shards is streamed in CreateTime order,
+        with messages repeated across shards (same non-zero MesSvrID and
+        CreateTime) yielded once.
         """
+        fields = set(MESSAGE_COLUMNS if columns is None else columns)
+        unknown = fields - set(MESSAGE_COLUMNS)
+        if unknown:
+            raise ValueError(f"unknown message column(s): {sorted(unknown)}")
+        # unprojected fields are selected as NULL, so rows map 1:1 onto RawMessage
+        select = ", ".join(col if f in fields else "NULL"
+                           for f, col in MESSAGE_COLUMNS.items())
+        where = f"WHERE Type IN ({','.join(map(str, types))})"
+        layout: Dict[str, List[sqlite3.Connection]] = {}     # chat → shards
         for shard in self.iter_shards():
             for chat_id, db in self.iter_chat_tables(shard):
-                q = (f"SELECT MesLocalID, Des, CreateTime, Type, Message "
-                     f"FROM Chat_{chat_id} WHERE Type IN ({','.join(map(str, types))})")
-                for mid, des, ts, tp, body in db.execute(q):
-                    yield chat_id, dict(mid=mid, sender_flag=des, ts=ts,
-                                        mtype=tp, body=_maybe_decompress(body))
+                layout.setdefault(chat_id, []).append(db)
+
+        for chat_id, dbs in layout.items():
+            tbl = f"Chat_{chat_id}"
+            if len(dbs) == 1:
+                for row in dbs[0].execute(f"SELECT {select} FROM {tbl} {where}"):
+                    yield chat_id, RawMessage(*row)
+                continue
+            cursors = [
+                db.execute(f"SELECT {select}, CreateTime, {dedup_key_sql(db, tbl)} "
+                           f"FROM {tbl} {where} ORDER BY CreateTime, rowid")
+                for db in dbs
+            ]
+            for row in merge_dedup(cursors, ts_index=5, key_index=6):
+                yield chat_id, RawMessage(*row[:5])
@@ -1 +1 @@
-__all__=['dump','mockgen']
+__all__=['bench','catalog','contacts','discovery','dump','mockgen','paging','profiling','search','state','writers']
@@ -1,9 +1,83 @@
 from __future__ import annotations
 import hashlib
-from datetime import datetime, timezone
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, List
 from zoneinfo import ZoneInfo
 
 LOCAL_TZ = ZoneInfo("Asia/Jerusalem")
 md5_hex = lambda s: hashlib.md5(s.encode('utf-8')).hexdigest()
 def utc_iso(ts:int)->str:
     return datetime.utcfromtimestamp(ts).isoformat()+'Z'
+
+_EPOCH=datetime(1970,1,1)
+@lru_cache(maxsize=8192)
+def _utc_day(day:int)->str:
+    return (_EPOCH+timedelta(days=day)).date().isoformat()+'T'
+
+def utc_iso_fast(ts:int)->str:
+    """utc_iso for whole seconds: cached date part + arithmetic clock part."""
+    day,sec=divmod(int(ts),86_400)
+    hh,rem=divmod(sec,3_600)
+    mm,ss=divmod(rem,60)
+    return f"{_utc_day(day)}{hh:02d}:{mm:02d}:{ss:02d}Z"
+
+@lru_cache(maxsize=1)
+def _clock_table()->tuple:
+    """'HH:MM:SSZ' for every second of a day – built once, ~5 MB."""
+    return tuple(f"{h:02d}:{m:02d}:{s:02d}Z" for h in range(24) for m in range(60) for s in range(60))
+
+def utc_iso_batch(ts_col:Iterable[int])->List[str]:
+    """
+    Column-wise utc_iso: the day prefix is reused while the timestamps stay
+    inside one day (a chat's rows come in CreateTime order), the clock part
+    is one tuple index.
+    """
+    clock=_clock_table()
+    out:List[str]=[]
+    append=out.append
+    prefix='';lo=hi=0
+    for ts in ts_col:
+        if not lo<=ts<hi:
+            day=int(ts)//86_400
+            prefix=_utc_day(day);lo=day*86_400;hi=lo+86_400
+        append(prefix+clock[int(ts)-lo])
+    return out
+
+def open_ro(db_path:Path,check_same_thread:bool=True)->sqlite3.Connection:
+    """Read-only, immutable handle – no locking or WAL probing on backup files."""
+    uri=Path(db_path).resolve().as_uri()+'?mode=ro&immutable=1'
+    return sqlite3.connect(uri,uri=True,check_same_thread=check_same_thread)
+
+def read_json(path:Path)->dict:
+    """JSON object at *path*, or {} if it is missing or unreadable."""
+    try:
+        data=json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError,ValueError):
+        return {}
+    return data if isinstance(data,dict) else {}
+
+def write_json(path:Path,data:Any,**dumps_kw)->bool:
+    """Atomic JSON write (tmp file + os.replace); False if *path* can't be written."""
+    path=Path(path)
+    tmp=path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(parents=True,exist_ok=True)
+        tmp.write_text(json.dumps(data,**dumps_kw),encoding='utf-8')
+        os.replace(tmp,path)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return False
+    return True
+
+def user_cache_path(kind:str,key:str)->Path:
+    """$XDG_CACHE_HOME/wechat_utils/<kind>-<md5(key)>.json (default ~/.cache)."""
+    base=os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),'.cache')
+    return Path(base)/'wechat_utils'/f'{kind}-{md5_hex(key)}.json'
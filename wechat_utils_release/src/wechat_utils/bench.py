@@ -0,0 +1,376 @@
+"""
+wechat_utils.bench – benchmarks for the dump engine on mock containers.
+
+• shard-scan / serialize: before/after micro-benchmarks on one container.
+• suite: seeded containers at several sizes (contacts x messages x slices),
+  each dumped – and optionally CSV-exported – in a fresh process; reports
+  rows/sec, peak RSS and per-stage timings as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple
+
+from . import dump, mockgen
+from ._helpers import utc_iso
+from .mockgen import build_container
+from .writers import open_writer
+
+
+# ───────────────────────── reference paths ──────────────────── #
+def baseline_fetch(db_path: Path, table: str) -> List[dump.Message]:
+    """The baseline per-chat query: its own connection, one Message per row."""
+    with sqlite3.connect(db_path) as con:
+        return [
+            dump.Message(utc_iso(ts), "out" if des == 1 else "in", tp, body, mes_id)
+            for ts, des, tp, body, mes_id in con.execute(
+                f"SELECT CreateTime, Des, Type, Message, MesLocalID FROM {table}"
+            )
+        ]
+
+
+def legacy_scan(acc_dir: Path) -> int:
+    """
+    Baseline engine: one connection per shard + one per Chat_ table.  Each
+    connection parses the shard's whole schema, so this is quadratic in
+    the number of chats – see bench_shard_scan.
+    """
+    rows = 0
+    for db_path in dump.db_chain(acc_dir / "DB"):
+        with sqlite3.connect(db_path) as con:
+            tables = dump.list_chat_tables(con)
+        for _, tbl in tables:
+            rows += len(baseline_fetch(db_path, tbl))
+    return rows
+
+
+def shard_scan(acc_dir: Path) -> int:
+    """Current engine: every shard opened once, read-only/immutable."""
+    return sum(c.message_count for c in dump.iter_conversations(acc_dir, None, None))
+
+
+def legacy_build(account_uid, hash_id, rows, contacts) -> dump.Conversation:
+    """Pre-columnar builder: one Message per row via datetime.utcfromtimestamp."""
+    rows = sorted(rows, key=lambda r: r[0])
+    msgs = [
+        dump.Message(utc_iso(ts), "out" if des == 1 else "in", tp, body, mes_id)
+        for ts, des, tp, body, mes_id in rows
+    ]
+    usr_name, nickname = contacts.get(hash_id, ("<unknown>", ""))
+    return dump.Conversation(account_uid, usr_name, nickname,
+                             dump.chat_kind(usr_name), msgs,
+                             msgs[0].timestamp, msgs[-1].timestamp, len(msgs))
+
+
+def baseline_dump(acc_dir: Path, fh: IO[str]) -> int:
+    """
+    The baseline wechat-dump: every chat's Message list bucketed, sorted,
+    asdict'ed and written as one indented JSON array.
+    """
+    db_dir = acc_dir / "DB"
+    contacts = dump.load_contacts(db_dir / "WCDB_Contact.sqlite")
+    bucket: Dict[str, List[dump.Message]] = {}
+    for db_path in dump.db_chain(db_dir):
+        with sqlite3.connect(db_path) as con:
+            tables = dump.list_chat_tables(con)
+        for hash_id, tbl in tables:
+            msgs = baseline_fetch(db_path, tbl)
+            if msgs:
+                bucket.setdefault(hash_id, []).extend(msgs)
+    convs = []
+    for hash_id, msgs in bucket.items():
+        msgs.sort(key=lambda m: m.timestamp)
+        usr_name, nickname = contacts.get(hash_id, ("<unknown>", ""))
+        convs.append(dump.Conversation(acc_dir.name, usr_name, nickname,
+                                       dump.chat_kind(usr_name), msgs,
+                                       msgs[0].timestamp, msgs[-1].timestamp,
+                                       len(msgs)))
+    json.dump([asdict(conv) for conv in convs], fh, ensure_ascii=False, indent=2)
+    return sum(conv.message_count for conv in convs)
+
+
+def _dump_with(fmt: str) -> Callable[[Path], int]:
+    """What wechat-dump runs now: streamed chats into the *fmt* writer."""
+    def run(acc_dir: Path) -> int:
+        rows = 0
+        with open_writer(fmt, Path(os.devnull)) as writer:
+            for conv in dump.iter_conversations(acc_dir, None, None,
+                                                build=dump.make_stream):
+                writer.write(conv)
+                rows += conv.message_count
+        return rows
+    return run
+
+
+def _baseline_run(acc_dir: Path) -> int:
+    with open(os.devnull, "w", encoding="utf-8") as fh:
+        return baseline_dump(acc_dir, fh)
+
+
+# ───────────────────────── runner ───────────────────────────── #
+def timed(fn: Callable[[Path], int], accounts, repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            rows = sum(fn(acc) for acc in accounts)
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": round(best, 4), "rows": rows,
+            "rows_per_sec": round(rows / best) if best else 0}
+
+
+def bench_shard_scan(container: Path, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """legacy_scan runs once (minutes on thousands of chats), shard_scan *repeat* times."""
+    accounts = dump.scan_accounts(container)
+    return {
+        "legacy_scan": timed(legacy_scan, accounts, 1),
+        "shard_scan": timed(shard_scan, accounts, repeat),
+    }
+
+
+def _convert_with(build, to_dict) -> Callable[[Path], int]:
+    """Row → JSON-ready dict conversion only, on rows fetched up front."""
+    def run(acc_dir: Path) -> int:
+        chats = [
+            (hash_id, rows)
+            for db_path in dump.db_chain(acc_dir / "DB")
+            for hash_id, rows in dump.extract_shard(db_path, None, None).items()
+        ]
+        start = time.perf_counter()
+        for hash_id, rows in chats:
+            to_dict(build(acc_dir.name, hash_id, rows, {}))
+        run.elapsed += time.perf_counter() - start
+        return sum(len(rows) for _, rows in chats)
+    run.elapsed = 0.0
+    return run
+
+
+def _speedup(result: Dict[str, Dict[str, float]], old: str, new: str) -> float:
+    return round(result[new]["rows_per_sec"] / max(result[old]["rows_per_sec"], 1), 2)
+
+
+def bench_serialize(container: Path, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Rows/sec of the baseline dump (per-row dataclasses, asdict, one indented
+    array) vs the columnar streaming one: end to end for the same JSON
+    output, for ndjson, and for the row-conversion stage alone.
+    """
+    accounts = dump.scan_accounts(container)
+    result = {
+        "baseline_json": timed(_baseline_run, accounts, repeat),
+        "columnar_json": timed(_dump_with("json"), accounts, repeat),
+        "columnar_ndjson": timed(_dump_with("ndjson"), accounts, repeat),
+    }
+    result["speedup"] = _speedup(result, "baseline_json", "columnar_json")
+    result["ndjson_speedup"] = _speedup(result, "baseline_json", "columnar_ndjson")
+
+    for name, build, to_dict in (
+        ("convert_dataclass_asdict", legacy_build, asdict),
+        ("convert_columnar_record", dump.make_record, lambda rec: rec),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            run = _convert_with(build, to_dict)
+            with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+                rows = sum(run(acc) for acc in accounts)
+            best = min(best, run.elapsed)
+        result[name] = {"seconds": round(best, 4), "rows": rows,
+                        "rows_per_sec": round(rows / best) if best else 0}
+    result["convert_speedup"] = _speedup(
+        result, "convert_dataclass_asdict", "convert_columnar_record"
+    )
+    return result
+
+
+# ───────────────────────── scale suite ──────────────────────── #
+Size = Tuple[int, int, int]            # contacts, messages per chat+slice, slices
+
+DEFAULT_SIZES = "100x50x2,1000x20x4,200x2000x2"
+
+
+def parse_sizes(spec: str) -> List[Size]:
+    """'100x50x2,1000x20x4' → [(100, 50, 2), (1000, 20, 4)]"""
+    sizes = []
+    for item in spec.split(","):
+        contacts, messages, slices = (int(part) for part in item.lower().split("x"))
+        sizes.append((contacts, messages, slices))
+    return sizes
+
+
+def _peak_rss_kib() -> int:
+    """Peak RSS of this process and its finished children, in KiB."""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak // 1024 if sys.platform == "darwin" else peak   # macOS: bytes
+
+
+def run_dump_case(container: Path, out_file: Path, fmt: str) -> Dict[str, Any]:
+    """One dump of *container*, staged – meant to run in a fresh process."""
+    stages: Dict[str, float] = {}
+    rows = 0
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        start = time.perf_counter()
+        accounts = dump.scan_accounts(container)
+        stages["discovery"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for acc in accounts:
+            dump.load_contacts(acc / "DB" / "WCDB_Contact.sqlite")
+        stages["contacts"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open_writer(fmt, out_file) as writer:
+            for acc in accounts:
+                for conv in dump.iter_conversations(acc, None, None,
+                                                    build=dump.make_stream):
+                    writer.write(conv)
+                    rows += conv.message_count
+        stages["dump"] = time.perf_counter() - start
+
+    return {
+        "rows": rows,
+        "bytes": out_file.stat().st_size,
+        "stages": {name: round(sec, 4) for name, sec in stages.items()},
+        "peak_rss_kib": _peak_rss_kib(),
+    }
+
+
+def run_export_case(container: Path, out_dir: Path, script: Path) -> Dict[str, Any]:
+    """main_wechat.py export-all on *container* as a child process."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(script), "--backup", str(container),
+         "export-all", "--out", str(out_dir)],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    return {
+        "seconds": round(time.perf_counter() - start, 4),
+        "peak_rss_kib": _peak_rss_kib(),
+    }
+
+
+def _fresh_process() -> ProcessPoolExecutor:
+    """
+    One worker that does not inherit this process's ru_maxrss.  A forked
+    child does, and on Linux so does fork+exec ("spawn"), so the worker
+    comes from a forkserver – itself small – where the platform has one.
+    """
+    method = ("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+              else "spawn")
+    return ProcessPoolExecutor(max_workers=1,
+                               mp_context=multiprocessing.get_context(method))
+
+
+def run_suite(
+    sizes: List[Size],
+    seed: int = 0,
+    fmt: str = "ndjson",
+    export_script: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """Generate, dump (and export) one seeded container per size."""
+    cases = []
+    for contacts, messages, slices in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            container = Path(tmp) / "mock"
+            mockgen.seed(seed)
+            start = time.perf_counter()
+            build_container(container, 1, contacts, messages, slices, fast=True)
+            generate = time.perf_counter() - start
+
+            # fresh process per measurement → its own peak RSS, cold caches
+            with _fresh_process() as pool:
+                case = pool.submit(run_dump_case, container,
+                                   Path(tmp) / f"dump.{fmt}", fmt).result()
+            case["stages"] = {"generate": round(generate, 4), **case["stages"]}
+            case["size"] = {"contacts": contacts, "messages": messages,
+                            "slices": slices}
+            dump_sec = case["stages"]["dump"]
+            case["rows_per_sec"] = round(case["rows"] / dump_sec) if dump_sec else 0
+
+            if export_script is not None:
+                with _fresh_process() as pool:
+                    export = pool.submit(run_export_case, container,
+                                         Path(tmp) / "export", export_script).result()
+                case["stages"]["export"] = export["seconds"]
+                case["export_rows_per_sec"] = (
+                    round(case["rows"] / export["seconds"]) if export["seconds"] else 0
+                )
+                case["export_peak_rss_kib"] = export["peak_rss_kib"]
+            cases.append(case)
+
+    return {
+        "seed": seed,
+        "format": fmt,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": cases,
+    }
+
+
+BENCHES = {
+    "shard-scan": bench_shard_scan,
+    "serialize": bench_serialize,
+}
+
+
+# ───────────────────────────── CLI ──────────────────────────── #
+def cli() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the WeChat dump engine on a mock container"
+    )
+    parser.add_argument("bench", choices=sorted([*BENCHES, "suite"]), nargs="?",
+                        default="shard-scan")
+    parser.add_argument("--container", type=Path,
+                        help="Existing container (default: generate one)")
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=2)
+    parser.add_argument("--slices", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="suite: comma list of CONTACTSxMESSAGESxSLICES")
+    parser.add_argument("--format", default="ndjson", choices=["json", "ndjson"],
+                        help="suite: dump output format")
+    parser.add_argument("--export-script", type=Path,
+                        help="suite: path to main_wechat.py to time CSV export too")
+    parser.add_argument("-o", "--out", type=Path,
+                        help="suite: write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.bench == "suite":
+        report = run_suite(parse_sizes(args.sizes), args.seed, args.format,
+                           args.export_script)
+        text = json.dumps(report, indent=2)
+        if args.out:
+            args.out.write_text(text + "\n", encoding="utf-8")
+        else:
+            print(text)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        container = args.container
+        if container is None:
+            mockgen.seed(args.seed)
+            container = Path(tmp) / "mock"
+            build_container(container, 1, args.contacts, args.messages, args.slices,
+                            fast=True)
+        print(json.dumps(BENCHES[args.bench](container, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    cli()
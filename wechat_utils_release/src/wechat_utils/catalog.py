@@ -0,0 +1,267 @@
+"""
+wechat_utils.catalog  –  shard order, duplicate keys, CreateTime ranges
+
+shard_chain() is the one definition of an account's shard order (MM.sqlite,
+then message_1 … message_N) shared by the dump and the wc/ readers;
+merge_dedup() merges their per-shard streams and drops messages that a
+migration left in more than one shard.
+
+A small JSON file next to the backup's DB/ folder records, for every
+Chat_<hash> table of every shard, its min/max CreateTime, row count and
+the name of an index whose first column is CreateTime (if any).  Entries
+are keyed by the shard's size + mtime, so a changed shard is re-scanned.
+On a read-only backup the file goes to the user cache dir instead
+($XDG_CACHE_HOME/wechat_utils/catalog-<md5(DB path)>.json), and every
+catalog read is also kept in-process, so a long-running caller stats the
+shards but never re-reads the JSON or re-scans an unchanged shard.
+With it a windowed dump skips whole shards and tables that cannot hold
+a matching row, and uses the CreateTime index for a range scan.
+"""
+from __future__ import annotations
+
+import sqlite3
+from bisect import bisect_left
+from itertools import chain, islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from ._helpers import open_ro, read_json, user_cache_path, write_json
+
+CATALOG_NAME = "wechat_utils.catalog.json"
+CATALOG_VERSION = 1
+CACHE_KIND = "catalog"
+MERGE_CHUNK = 4_096                     # rows buffered per stream by merge_chunks
+
+CHAT_TABLES_SQL = (
+    "SELECT name FROM sqlite_master "
+    "WHERE type='table' AND name LIKE 'Chat_%' "
+    "AND name NOT LIKE 'ChatExt2_%'"
+)
+
+
+def shard_chain(db_dir: Path) -> List[Path]:
+    """[MM.sqlite] + message_<n>.sqlite by n – the canonical shard order."""
+    numbered = []
+    for path in Path(db_dir).glob("message_*.sqlite"):
+        suffix = path.stem.split("_", 1)[1]
+        if suffix.isdigit():
+            numbered.append((int(suffix), path))
+    slices = [path for _, path in sorted(numbered)]
+    mm = Path(db_dir) / "MM.sqlite"
+    return [mm] + slices if mm.exists() else slices
+
+
+def dedup_key_sql(con: sqlite3.Connection, table: str) -> str:
+    """
+    SQL for a message's cross-shard identity: its non-zero MesSvrID, else
+    NULL (never deduplicated).  MesLocalID is a per-table autoincrement –
+    two shards of one chat reuse the same local ids – so it is no identity.
+    """
+    cols = {
+        name.decode() if isinstance(name, bytes) else name      # text_factory=bytes
+        for _, name, *_ in con.execute(f"PRAGMA table_info({table})")
+    }
+    if "MesSvrID" in cols:
+        return "NULLIF(MesSvrID, 0)"
+    return "NULL"
+
+
+def merge_chunks(
+    sources: Sequence[Iterable[tuple]],
+    ts_index: int = 0,
+    chunk: int = MERGE_CHUNK,
+) -> Iterator[List[tuple]]:
+    """
+    Stable k-way merge of row streams that are each in CreateTime order,
+    as a series of sorted lists.  Every row older than the newest row
+    buffered from some unfinished stream is cut from the buffers, the cuts
+    are joined in stream order and sorted by CreateTime – a stable sort, so
+    ties keep stream order exactly as heapq.merge does, but in C instead
+    of one generator step per row.  A second never spans two lists.
+    Memory is bounded by *chunk* rows per stream plus the busiest second.
+    """
+    get_ts = itemgetter(ts_index)
+    its = [iter(source) for source in sources]
+    bufs: List[List[tuple]] = [[] for _ in its]
+    more = [True] * len(its)
+    while True:
+        for i, it in enumerate(its):
+            if more[i] and not bufs[i]:
+                bufs[i] = list(islice(it, chunk))
+                more[i] = len(bufs[i]) == chunk
+        tails = [get_ts(buf[-1]) for buf, m in zip(bufs, more) if m]
+        cut = min(tails) if tails else None     # None: every stream fully buffered
+        out: List[tuple] = []
+        parts = 0
+        for i, buf in enumerate(bufs):
+            if not buf:
+                continue
+            if cut is None:
+                n = len(buf)
+            elif get_ts(buf[0]) >= cut:
+                continue
+            else:
+                n = bisect_left(list(map(get_ts, buf)), cut)
+            out += buf[:n]
+            del buf[:n]
+            parts += 1
+        if out:
+            if parts > 1:
+                out.sort(key=get_ts)
+            yield out
+        elif cut is None:
+            return
+        else:                               # a stream still ends on second *cut*
+            for i, buf in enumerate(bufs):
+                if more[i] and get_ts(buf[-1]) == cut:
+                    extra = list(islice(its[i], chunk))
+                    buf += extra
+                    more[i] = len(extra) == chunk
+
+
+def merge_dedup_chunks(
+    sources: Sequence[Iterable[tuple]],
+    ts_index: int = 0,
+    key_index: int = -1,
+    chunk: int = MERGE_CHUNK,
+) -> Iterator[List[tuple]]:
+    """
+    merge_chunks() without rows whose (key, CreateTime) was already seen.
+    Duplicates share a CreateTime and a second never spans two chunks, so
+    a chunk whose (CreateTime, key) pairs are all distinct – the common
+    case – is passed through untouched.  Rows with a NULL key are never
+    dropped.
+    """
+    get_ts = itemgetter(ts_index)
+    get_key = itemgetter(key_index)
+    for rows in merge_chunks(sources, ts_index, chunk):
+        pairs = list(zip(map(get_ts, rows), map(get_key, rows)))
+        if len(set(pairs)) == len(pairs):
+            yield rows
+            continue
+        current = None
+        seen: set = set()
+        kept: List[tuple] = []
+        for row, (ts, key) in zip(rows, pairs):
+            if ts != current:
+                current = ts
+                seen.clear()
+            if key is None:
+                kept.append(row)
+            elif key not in seen:
+                seen.add(key)
+                kept.append(row)
+        yield kept
+
+
+def merge_dedup(
+    sources: Sequence[Iterable[tuple]],
+    ts_index: int = 0,
+    key_index: int = -1,
+) -> Iterator[tuple]:
+    """
+    Merge per-shard row streams that are each in CreateTime order and
+    drop rows whose (key, CreateTime) was already seen.  Duplicates share a
+    CreateTime, so only the keys of the current second are remembered –
+    memory is bounded by the merge chunk and the busiest second, not by
+    the chat.  Rows with a NULL key are never dropped.  Ties keep shard
+    order.  Row by row over merge_dedup_chunks().
+    """
+    return chain.from_iterable(merge_dedup_chunks(sources, ts_index, key_index))
+
+
+_MEMO: Dict[str, Dict[str, tuple]] = {}    # resolved DB/ → {shard: (stamp, tables)}
+
+
+class Span(NamedTuple):
+    min_ts: Optional[int]
+    max_ts: Optional[int]
+    rows: int
+    index: Optional[str]          # CreateTime-leading index, if present
+
+
+def createtime_index(con: sqlite3.Connection, table: str) -> str | None:
+    """Name of an index on *table* whose first column is CreateTime."""
+    for row in con.execute(f"PRAGMA index_list({table})"):
+        name = row[1]
+        cols = con.execute(f"PRAGMA index_info({name})").fetchall()
+        if cols and cols[0][2] == "CreateTime":
+            return name
+    return None
+
+
+def describe_shard(db_path: Path) -> Dict[str, Span]:
+    """{Chat_<hash>: Span} for every chat table of one shard."""
+    spans: Dict[str, Span] = {}
+    con = open_ro(db_path)
+    try:
+        for (table,) in con.execute(CHAT_TABLES_SQL).fetchall():
+            lo, hi, n = con.execute(
+                f"SELECT min(CreateTime), max(CreateTime), count(*) FROM {table}"
+            ).fetchone()
+            spans[table] = Span(lo, hi, n, createtime_index(con, table))
+    finally:
+        con.close()
+    return spans
+
+
+def overlaps(span: Span, t_min: float | None, t_max: float | None) -> bool:
+    """Can a table with this span hold a row inside [t_min, t_max]?"""
+    if span.min_ts is None:
+        return False                                   # empty table
+    if t_min is not None and span.max_ts < int(t_min):
+        return False
+    if t_max is not None and span.min_ts > int(t_max):
+        return False
+    return True
+
+
+def _stamp(db_path: Path) -> List[int]:
+    st = db_path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_entries(db_dir: Path, key: str) -> Dict[str, dict]:
+    for path in (db_dir / CATALOG_NAME, user_cache_path(CACHE_KIND, key)):
+        cached = read_json(path)
+        if cached.get("version") == CATALOG_VERSION:
+            return cached.get("shards", {})
+    return {}
+
+
+def load_catalog(db_dir: Path, shards: List[Path]) -> Dict[str, Dict[str, Span]]:
+    """
+    {shard file name: {table: Span}} for *shards*, from the in-process
+    cache, else the cache file in *db_dir* (or the user cache dir), and
+    refreshed for shards whose size/mtime changed.  The returned tables
+    are shared with the cache – treat them as read-only.
+    """
+    db_dir = Path(db_dir)
+    key = str(db_dir.resolve())
+    memo = _MEMO.setdefault(key, {})
+    entries = None                              # disk cache, read on first miss
+
+    catalog: Dict[str, Dict[str, Span]] = {}
+    dirty = False
+    for db_path in shards:
+        stamp = _stamp(db_path)
+        hit = memo.get(db_path.name)
+        if hit is None or hit[0] != stamp:
+            if entries is None:
+                entries = _read_entries(db_dir, key)
+            entry = entries.get(db_path.name)
+            if entry is None or entry["stamp"] != stamp:
+                entry = {"stamp": stamp, "tables": describe_shard(db_path)}
+                entries[db_path.name] = entry
+                dirty = True
+            hit = memo[db_path.name] = stamp, {
+                table: Span(*span) for table, span in entry["tables"].items()
+            }
+        catalog[db_path.name] = hit[1]
+
+    if dirty:
+        data = {"version": CATALOG_VERSION, "shards": entries}
+        if not write_json(db_dir / CATALOG_NAME, data):       # read-only backup
+            write_json(user_cache_path(CACHE_KIND, key), data)
+    return catalog
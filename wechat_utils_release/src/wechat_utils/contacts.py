@@ -0,0 +1,98 @@
+"""
+wechat_utils.contacts  –  cached contact maps for WCDB_Contact.sqlite
+
+Reading the Friend table and MD5-hashing every UsrName is repeated by the
+dump, the CSV export (main_wechat.py) and the wc readers.  Results are
+cached twice:
+
+• on disk, in the user cache dir (one file per contact DB, never inside
+  the backup tree), keyed by the DB's size + mtime;
+• in-process, in a small LRU shared by every caller.
+
+Cached values are shared – treat them as read-only.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from ._helpers import md5_hex, open_ro, read_json, user_cache_path, write_json
+
+CACHE_KIND = "contacts"
+LRU_SIZE = 32
+
+_LRU: "OrderedDict[Tuple[str, str, int, int], Any]" = OrderedDict()
+
+
+def _file_stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def cached(
+    contact_db: Path,
+    kind: str,
+    compute: Callable[[Path], Any],
+    persist: bool = True,
+) -> Any:
+    """
+    compute(contact_db) memoised per (*kind*, file, size, mtime) – first in
+    the LRU, then (if *persist*) in the on-disk cache under
+    user_cache_path, in which case *compute* must return JSON data.
+    """
+    contact_db = Path(contact_db)
+    size, mtime = _file_stamp(contact_db)
+    key = (kind, str(contact_db.resolve()), size, mtime)
+    if key in _LRU:
+        _LRU.move_to_end(key)
+        return _LRU[key]
+
+    if not persist:
+        value = compute(contact_db)
+    else:
+        cache = user_cache_path(CACHE_KIND, key[1])
+        entries = read_json(cache)
+        entry = entries.get(kind)
+        if entry and entry.get("stamp") == [size, mtime]:
+            value = entry["data"]
+        else:
+            value = compute(contact_db)
+            entries[kind] = {"stamp": [size, mtime], "data": value}
+            write_json(cache, entries, ensure_ascii=False)
+
+    _LRU[key] = value
+    if len(_LRU) > LRU_SIZE:
+        _LRU.popitem(last=False)
+    return value
+
+
+def _read_friends(contact_db: Path) -> List[List[str]]:
+    con = open_ro(contact_db)
+    try:
+        rows = con.execute(
+            "SELECT UsrName, NickName, Alias FROM Friend WHERE UsrName IS NOT NULL"
+        ).fetchall()
+    finally:
+        con.close()
+    return [[md5_hex(usr), usr, nick, alias] for usr, nick, alias in rows]
+
+
+def friend_rows(contact_db: Path) -> List[List[str]]:
+    """[[MD5(UsrName), UsrName, NickName, Alias], …] in Friend order."""
+    return cached(contact_db, "friend", _read_friends)
+
+
+def contact_map(contact_db: Path) -> Dict[str, Tuple[str, str]]:
+    """MD5(UsrName) → (UsrName, Nick/Alias), or {} if the DB is missing."""
+    contact_db = Path(contact_db)
+    if not contact_db.exists():
+        return {}
+    return cached(
+        contact_db,
+        "friend_map",
+        lambda db: {
+            h: (usr, nick or alias or "") for h, usr, nick, alias in friend_rows(db)
+        },
+        persist=False,
+    )
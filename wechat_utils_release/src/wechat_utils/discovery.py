@@ -0,0 +1,147 @@
+"""
+wechat_utils.discovery  –  find the WeChat accounts inside a backup
+
+An account is a Documents/<uid>/ folder with DB/WCDB_Contact.sqlite.  The
+known layouts (ROOT/AppDomain-com.tencent.xin/Documents, ROOT/Documents or
+ROOT itself) are tried first; only if none holds an account is the tree
+walked with os.scandir – at most SCAN_DEPTH levels, never into symlinks,
+hidden folders, other apps' domains or a Documents folder's accounts
+(their media trees are where a full backup's files live).
+
+The result is cached per backup root, in-process and in the user cache
+dir ($XDG_CACHE_HOME/wechat_utils/accounts-<md5(root)>.json – the backup
+itself is never written to).  It is keyed by the mtime of the root, of
+every folder the search probed or walked, and of every Documents/<uid>/
+folder and its DB/WCDB_Contact.sqlite, so a backup added elsewhere in the tree or a
+contact DB appearing in an existing uid folder re-discovers.  A backup
+without accounts is not cached; refresh=True (--rediscover) bypasses it.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ._helpers import read_json, user_cache_path, write_json
+
+CACHE_KIND = "accounts"
+CACHE_VERSION = 2
+SCAN_DEPTH = 6
+APP_DOMAIN = "AppDomain-com.tencent.xin"
+KNOWN_DOCUMENTS = (f"{APP_DOMAIN}/Documents", "Documents", ".")
+
+Stamp = List[Tuple[str, Optional[int]]]    # (path, mtime_ns or None if missing) …
+
+_MEMO: Dict[str, Tuple[Stamp, List[str]]] = {}
+
+
+def accounts_in(docs: Path) -> List[Path]:
+    """Sorted <uid> folders of one Documents folder."""
+    try:
+        entries = list(os.scandir(docs))
+    except OSError:
+        return []
+    return sorted(
+        Path(entry.path) for entry in entries
+        if entry.is_dir(follow_symlinks=False)
+        and os.path.isfile(os.path.join(entry.path, "DB", "WCDB_Contact.sqlite"))
+    )
+
+
+def _prune(name: str) -> bool:
+    if name.startswith("."):
+        return True
+    # AppDomain-…, AppDomainGroup-…, AppDomainPlugin-… of other apps
+    return "Domain" in name and "-" in name and "com.tencent.xin" not in name
+
+
+def walk_documents(
+    root: Path,
+    depth: int = SCAN_DEPTH,
+    visited: Optional[List[str]] = None,
+) -> List[Path]:
+    """
+    Documents folders holding accounts, breadth-first, *depth* levels deep.
+    Every folder listed is appended to *visited*, if given.
+    """
+    found: List[Path] = []
+    level = [str(root)]
+    for _ in range(depth + 1):
+        below: List[str] = []
+        for folder in level:
+            try:
+                entries = sorted(os.scandir(folder), key=lambda e: e.name)
+            except OSError:
+                continue
+            if visited is not None:
+                visited.append(folder)
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False) or _prune(entry.name):
+                    continue
+                if entry.name == "Documents" and accounts_in(Path(entry.path)):
+                    found.append(Path(entry.path))     # don't descend into accounts
+                else:
+                    below.append(entry.path)
+        if not below:
+            break
+        level = below
+    return found
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _stamp(probed: List[str], docs: List[Path]) -> Stamp:
+    """
+    mtimes of the *probed* folders, of every uid/ in *docs* and of its
+    contact DB (not of DB/ itself, where the contact and catalog caches live).
+    """
+    paths = dict.fromkeys(probed)
+    for d in docs:
+        paths[str(d)] = None
+        try:
+            entries = list(os.scandir(d))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                paths[entry.path] = None
+                paths[os.path.join(entry.path, "DB", "WCDB_Contact.sqlite")] = None
+    return [(path, _mtime(path)) for path in paths]
+
+
+def _still_valid(stamp: Stamp) -> bool:
+    return all(_mtime(path) == mtime for path, mtime in stamp)
+
+
+def discover_accounts(root: Path, refresh: bool = False) -> List[Path]:
+    """Account folders under backup *root*, cached until the layout changes."""
+    root = Path(root).resolve()
+    key = str(root)
+    if not refresh:
+        hit = _MEMO.get(key)
+        if hit is None:
+            cached = read_json(user_cache_path(CACHE_KIND, key))
+            if cached.get("version") == CACHE_VERSION:
+                hit = [tuple(item) for item in cached["stamp"]], cached["accounts"]
+        if hit is not None and _still_valid(hit[0]):
+            _MEMO[key] = hit
+            return [Path(acc) for acc in hit[1]]
+
+    # the probed layouts, their parents and the root: a new top-level
+    # folder or Documents folder changes one of these mtimes
+    probed = [key, str(root / APP_DOMAIN)] + [str(root / rel) for rel in KNOWN_DOCUMENTS]
+    docs = [root / rel for rel in KNOWN_DOCUMENTS if accounts_in(root / rel)][:1]
+    if not docs:
+        docs = walk_documents(root, visited=probed)
+    accounts = [str(acc) for d in docs for acc in accounts_in(d)]
+    if accounts:
+        stamp = _stamp(probed, docs)
+        _MEMO[key] = stamp, accounts
+        write_json(user_cache_path(CACHE_KIND, key),
+                   {"version": CACHE_VERSION, "stamp": stamp, "accounts": accounts})
+    return [Path(acc) for acc in accounts]
@@ -4,17 +4,29 @@ wechat_utils.dump  –  export iOS WeChat backups to JSON
 """
 from __future__ import annotations
 
-import json
+import cProfile
+import os
 import sqlite3
-from dataclasses import asdict, dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, time, timezone
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Tuple
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import click
 from zoneinfo import ZoneInfo
 
-from ._helpers import LOCAL_TZ, md5_hex, utc_iso
+from ._helpers import LOCAL_TZ, open_ro, utc_iso_batch, utc_iso_fast
+from .catalog import (CHAT_TABLES_SQL, dedup_key_sql, load_catalog, merge_chunks,
+                      merge_dedup, merge_dedup_chunks, overlaps, shard_chain)
+from .contacts import contact_map
+from .discovery import discover_accounts
+from .profiling import Profile, body_bytes
+from .state import DumpState, Mark, high_water
+from .writers import WRITERS, ChatRows, ChatStream, open_writer, parquet_schema
 
 # ───────────────────────── dataclasses ──────────────────────────
 @dataclass
@@ -38,27 +50,23 @@ class Conversation:
     message_count: int
 
 
+Row = Tuple[int, int, int, str, int]   # CreateTime, Des, Type, Message, MesLocalID
+ChatTable = Tuple[str, str, Optional[str]]   # hash, Chat_<hash>, CreateTime index
+Builder = Callable[[str, str, Iterable[Row], Dict[str, Tuple[str, str]]], Any]
+
+BATCH_SIZE = 5_000                      # rows per fetchmany
+_ROW = itemgetter(slice(0, 5))          # strip the dedup-key column
+
+
 # ───────────────────────── helpers ──────────────────────────────
-def scan_accounts(root: Path) -> List[Path]:
-    """Return every Documents/<uid>/ folder that has a DB/ directory."""
-    accounts: List[Path] = []
-    for docs in root.rglob("Documents"):
-        for uid_dir in docs.iterdir():
-            contact_db = uid_dir / "DB" / "WCDB_Contact.sqlite"
-            if contact_db.is_file():
-                accounts.append(uid_dir)
-    return accounts
+def scan_accounts(root: Path, refresh: bool = False) -> List[Path]:
+    """Return every Documents/<uid>/ folder that has a DB/ directory (see discovery)."""
+    return discover_accounts(root, refresh)
 
 
 def db_chain(db_dir: Path) -> List[Path]:
-    """Return [MM.sqlite] + ordered message_n.sqlite paths."""
-    slices: List[Path] = sorted(
-        db_dir.glob("message_*.sqlite"),
-        key=lambda p: int(p.stem.split("_")[1]),
-    )
-    if (db_dir / "MM.sqlite").exists():
-        return [db_dir / "MM.sqlite"] + slices
-    return slices
+    """Return [MM.sqlite] + ordered message_n.sqlite paths (see catalog.shard_chain)."""
+    return shard_chain(db_dir)
 
 
 def chat_kind(usr_name: str) -> str:
@@ -107,129 +115,756 @@ def build_window(
 
 # ──────────────── DB-level helpers ──────────────────────────────
 def load_contacts(contact_db: Path) -> dict[str, Tuple[str, str]]:
-    """Return MD5(UsrName) → (UsrName, Nick/Alias)."""
-    mapping: dict[str, Tuple[str, str]] = {}
-    if not contact_db.exists():
-        return mapping
-
-    with sqlite3.connect(contact_db) as con:
-        rows = con.execute(
-            "SELECT UsrName, NickName, Alias FROM Friend WHERE UsrName IS NOT NULL"
-        )
-        for usr, nick, alias in rows:
-            mapping[md5_hex(usr)] = (usr, nick or alias or "")
-    return mapping
+    """Return MD5(UsrName) → (UsrName, Nick/Alias) – cached, see .contacts."""
+    return contact_map(contact_db)
 
 
 def list_chat_tables(con: sqlite3.Connection) -> List[Tuple[str, str]]:
-    sql = (
-        "SELECT name FROM sqlite_master "
-        "WHERE type='table' AND name LIKE 'Chat_%' "
-        "AND name NOT LIKE 'ChatExt2_%'"
-    )
-    # return [(name[5:], name) for (name,) in con.execute(sql)]
-    n = [(name[5:], name) for (name,) in con.execute(sql)]
-    print(n)
-    return n
+    return [(name[5:], name) for (name,) in con.execute(CHAT_TABLES_SQL)]
 
 
-def fetch_messages(
-    db_path: Path,
-    table: str,
+def plan_shards(
+    db_dir: Path,
     t_min: float | None,
     t_max: float | None,
-) -> List[Message]:
-    clauses: List[str] = []
-    params: List[int] = []
-
+) -> List[Tuple[Path, List[ChatTable] | None]]:
+    """
+    [(shard, tables)] in db_chain order.  Without a window *tables* is None
+    (list them once the shard is open).  With one, the time catalog prunes
+    every table – and so every shard – whose CreateTime range misses it,
+    and supplies each table's CreateTime index for a range scan.
+    """
+    shards = db_chain(db_dir)
+    if t_min is None and t_max is None:
+        return [(db_path, None) for db_path in shards]
+
+    catalog = load_catalog(db_dir, shards)
+    plan: List[Tuple[Path, List[ChatTable] | None]] = []
+    for db_path in shards:
+        tables = [
+            (table[5:], table, span.index)
+            for table, span in catalog[db_path.name].items()
+            if overlaps(span, t_min, t_max)
+        ]
+        if tables:
+            plan.append((db_path, tables))
+    return plan
+
+
+def shard_tables(
+    con: sqlite3.Connection,
+    planned: List[ChatTable] | None,
+) -> List[ChatTable]:
+    if planned is not None:
+        return planned
+    return [(hash_id, table, None) for hash_id, table in list_chat_tables(con)]
+
+
+def _window_clause(
+    t_min: float | None,
+    t_max: float | None,
+    clauses: List[str] | None = None,
+    params: List[int] | None = None,
+) -> Tuple[str, List[int]]:
+    """' WHERE …' and its parameters: *clauses* (if any), then the CreateTime window."""
+    clauses = list(clauses or [])
+    params = list(params or [])
     if t_min is not None:
         clauses.append("CreateTime >= ?")
         params.append(int(t_min))
     if t_max is not None:
         clauses.append("CreateTime <= ?")
         params.append(int(t_max))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
 
-    where = ""
-    if clauses:
-        where = " WHERE " + " AND ".join(clauses)
 
+def iter_row_batches(
+    con: sqlite3.Connection,
+    table: str,
+    t_min: float | None,
+    t_max: float | None,
+    after: Mark | None = None,
+    batch_size: int = BATCH_SIZE,
+    index: str | None = None,
+    key_sql: str | None = None,
+) -> Iterator[List[Row]]:
+    """
+    Raw (CreateTime, Des, Type, Message, MesLocalID) tuples of one table in
+    CreateTime order (rowid breaks ties), pulled with fetchmany in batches
+    of *batch_size*.
+
+    *after* is a high-water mark from the state file: only rows past it
+    (by MesLocalID, or CreateTime when the IDs are missing) are returned.
+    *index* names a CreateTime index to range-scan when a window is given.
+    *key_sql* appends a sixth, dedup-key column (see merge_rows).
+    """
+    clauses: List[str] = []
+    params: List[int] = []
+
+    if after is not None:
+        mark_id, mark_ts = after
+        if mark_id is not None:
+            clauses.append("MesLocalID > ?")
+            params.append(mark_id)
+        elif mark_ts is not None:
+            clauses.append("CreateTime > ?")
+            params.append(mark_ts)
+    where, params = _window_clause(t_min, t_max, clauses, params)
+
+    source = table
+    if index is not None and (t_min is not None or t_max is not None):
+        source = f"{table} INDEXED BY {index}"
+
+    key = f", {key_sql}" if key_sql else ""
     sql = (
-        f"SELECT CreateTime, Des, Type, Message, MesLocalID "
-        f"FROM {table}{where}"
+        f"SELECT CreateTime, Des, Type, Message, MesLocalID{key} "
+        f"FROM {source}{where} ORDER BY CreateTime, rowid"
     )
-    print(f"DEBUG - {table=}\n{where=}")
-    messages: List[Message] = []
-    with sqlite3.connect(db_path) as con:
-        for ts, des, msg_type, body, mes_id in con.execute(sql, params):
-            direction = "out" if des == 1 else "in"
-            messages.append(
-                Message(utc_iso(ts), direction, msg_type, body, mes_id)
+    cur = con.execute(sql, params)
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def fetch_rows(
+    con: sqlite3.Connection,
+    table: str,
+    t_min: float | None,
+    t_max: float | None,
+    after: Mark | None = None,
+    index: str | None = None,
+    key_sql: str | None = None,
+) -> List[Row]:
+    rows: List[Row] = []
+    for batch in iter_row_batches(con, table, t_min, t_max, after, index=index,
+                                  key_sql=key_sql):
+        rows.extend(batch)
+    return rows
+
+
+class ShardRows:
+    """
+    Ordered row stream of one Chat_<hash> table in one shard.  When
+    *track* is set, the table's high-water mark follows the rows consumed;
+    a *profile* times the fetches and counts rows and bytes.
+    """
+
+    def __init__(
+        self,
+        shard_name: str,
+        con: sqlite3.Connection,
+        table: str,
+        t_min: float | None,
+        t_max: float | None,
+        after: Mark | None = None,
+        track: bool = False,
+        index: str | None = None,
+        key_sql: str | None = None,
+        profile: Profile | None = None,
+    ) -> None:
+        self.shard_name = shard_name
+        self.table = table
+        self.mark = after
+        self.advanced = False
+        self._batches = iter_row_batches(con, table, t_min, t_max, after, index=index,
+                                         key_sql=key_sql)
+        if profile is not None:
+            self._batches = profile.scan(shard_name, table, self._batches)
+        self._track = track
+
+    def __iter__(self) -> Iterator[Row]:
+        if not self._track:
+            return chain.from_iterable(self._batches)   # no Python step per row
+        return self._tracked()
+
+    def _tracked(self) -> Iterator[Row]:
+        for batch in self._batches:
+            self.mark = high_water(batch, self.mark)
+            self.advanced = True
+            yield from batch
+
+
+def merge_rows(sources: List[Iterable[Row]], keyed: bool = False) -> Iterator[Row]:
+    """
+    k-way merge of per-shard streams that are each in CreateTime order
+    (catalog.merge_chunks).  Ties keep shard order, so the result equals a
+    stable sort of the shard concatenation without holding the chat in
+    memory.
+
+    *keyed* sources carry a sixth dedup-key column (key_sql): a message
+    found in several shards is kept once (catalog.merge_dedup_chunks) and
+    the key is stripped again.
+    """
+    if keyed:
+        if len(sources) == 1:
+            return map(_ROW, sources[0])
+        return chain.from_iterable(
+            map(_ROW, rows) for rows in merge_dedup_chunks(sources, 0, 5)
+        )
+    if len(sources) == 1:
+        return iter(sources[0])
+    return chain.from_iterable(merge_chunks(sources, 0))
+
+
+def to_message(row: Row) -> Message:
+    ts, des, msg_type, body, mes_id = row
+    direction = "out" if des == 1 else "in"
+    return Message(utc_iso_fast(ts), direction, msg_type, body, mes_id)
+
+
+def fetch_messages(
+    con: sqlite3.Connection,
+    table: str,
+    t_min: float | None,
+    t_max: float | None,
+) -> List[Message]:
+    return [to_message(row) for row in fetch_rows(con, table, t_min, t_max)]
+
+
+def extract_shard(
+    db_path: Path,
+    t_min: float | None,
+    t_max: float | None,
+    marks: dict[str, Mark] | None = None,
+    tables: List[ChatTable] | None = None,
+    keyed: bool = False,
+) -> dict[str, List[Row]]:
+    """
+    Read the Chat_<hash> tables of one shard → {hash: ordered rows}.
+    *tables* is the pruned list from plan_shards (default: all of them);
+    *keyed* rows carry the dedup-key column for merge_rows(keyed=True).
+    """
+    out: dict[str, List[Row]] = {}
+    marks = marks or {}
+    con = open_ro(db_path)
+    try:
+        for hash_id, chat_tbl, index in shard_tables(con, tables):
+            key_sql = dedup_key_sql(con, chat_tbl) if keyed else None
+            out.setdefault(hash_id, []).extend(
+                fetch_rows(con, chat_tbl, t_min, t_max, marks.get(chat_tbl), index,
+                           key_sql)
             )
-    return messages
+    finally:
+        con.close()
+    return out
 
 
 # ─────────────── conversation builder ──────────────────────────
-def build_conversations(
+def message_dicts(rows: List[Row]) -> List[dict]:
+    """
+    Columnar conversion of a batch of rows into JSON-ready message dicts –
+    no Message objects, timestamps converted with the cached day prefix.
+    """
+    ts_col, des_col, type_col, body_col, id_col = zip(*rows)
+    return [
+        {
+            "timestamp": stamp,
+            "direction": "out" if des == 1 else "in",
+            "msg_type": msg_type,
+            "body": body,
+            "mes_local_id": mes_id,
+        }
+        for stamp, des, msg_type, body, mes_id
+        in zip(utc_iso_batch(ts_col), des_col, type_col, body_col, id_col)
+    ]
+
+
+def _chat_header(
+    account_uid: str,
+    hash_id: str,
+    contacts: dict[str, Tuple[str, str]],
+) -> dict:
+    usr_name, nickname = contacts.get(hash_id, ("<unknown>", ""))
+    return {
+        "account_uid": account_uid,
+        "usrname": usr_name,
+        "nickname": nickname,
+        "chat_type": chat_kind(usr_name),
+    }
+
+
+def make_conversation(
+    account_uid: str,
+    hash_id: str,
+    rows: Iterable[Row],
+    contacts: dict[str, Tuple[str, str]],
+) -> Conversation | None:
+    """Turn the rows of one chat, already in CreateTime order, into a Conversation."""
+    msgs = [to_message(row) for row in rows]
+    if not msgs:
+        return None
+
+    usr_name, nickname = contacts.get(hash_id, ("<unknown>", ""))
+    return Conversation(
+        account_uid=account_uid,
+        usrname=usr_name,
+        nickname=nickname,
+        chat_type=chat_kind(usr_name),
+        messages=msgs,
+        first_ts=msgs[0].timestamp,
+        last_ts=msgs[-1].timestamp,
+        message_count=len(msgs),
+    )
+
+
+def make_record(
+    account_uid: str,
+    hash_id: str,
+    rows: Iterable[Row],
+    contacts: dict[str, Tuple[str, str]],
+) -> dict | None:
+    """
+    Columnar fast path: the same JSON shape as asdict(make_conversation(...))
+    built straight from the row tuples – no Message objects, no deep copy.
+    """
+    rows = list(rows)
+    if not rows:
+        return None
+    msgs = message_dicts(rows)
+    record = _chat_header(account_uid, hash_id, contacts)
+    record.update(
+        messages=msgs,
+        first_ts=msgs[0]["timestamp"],
+        last_ts=msgs[-1]["timestamp"],
+        message_count=len(msgs),
+    )
+    return record
+
+
+def _batched(rows: Iterable[Row]) -> Iterator[List[Row]] | None:
+    """*rows* in lists of BATCH_SIZE, read lazily; None if there are none."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return None
+    pending = chain((first,), rows)
+    return iter(lambda: list(islice(pending, BATCH_SIZE)), [])
+
+
+def make_stream(
+    account_uid: str,
+    hash_id: str,
+    rows: Iterable[Row],
+    contacts: dict[str, Tuple[str, str]],
+) -> ChatStream | None:
+    """
+    Streaming path: messages are converted batch by batch while the writer
+    consumes them, so a chat never has to be held in memory as a whole.
+    """
+    batches = _batched(rows)
+    if batches is None:
+        return None
+    return ChatStream(_chat_header(account_uid, hash_id, contacts),
+                      map(message_dicts, batches))
+
+
+def make_rows(
+    account_uid: str,
+    hash_id: str,
+    rows: Iterable[Row],
+    contacts: dict[str, Tuple[str, str]],
+) -> ChatRows | None:
+    """Columnar-output path: the raw row batches, untouched, for ParquetWriter."""
+    batches = _batched(rows)
+    if batches is None:
+        return None
+    header = _chat_header(account_uid, hash_id, contacts)
+    header["chat_hash"] = hash_id
+    return ChatRows(header, batches)
+
+
+def _timed_contacts(db_dir: Path, profile: Profile | None) -> dict[str, Tuple[str, str]]:
+    if profile is None:
+        return load_contacts(db_dir / "WCDB_Contact.sqlite")
+    with profile.stage("contacts"):
+        return load_contacts(db_dir / "WCDB_Contact.sqlite")
+
+
+def _commit_marks(
+    state: DumpState | None,
+    account_uid: str,
+    advanced: List[Tuple[str, str, Mark]],
+) -> None:
+    """Persist the new marks of one conversation once it has been written."""
+    if state is None or not advanced:
+        return
+    for shard_name, chat_tbl, mark in advanced:
+        state.advance(account_uid, shard_name, chat_tbl, mark)
+    state.commit()
+
+
+def iter_conversations(
     acc_dir: Path,
     t_min: float | None,
     t_max: float | None,
-) -> List[Conversation]:
+    state: DumpState | None = None,
+    build: Builder = make_conversation,
+    profile: Profile | None = None,
+) -> Iterator[Any]:
+    """
+    Yield one Conversation at a time – only a single chat is in memory
+    (with build=make_stream, not even that).
+
+    Every shard is opened once (read-only, immutable) and all of its
+    Chat_<hash> tables are read through that one handle; the per-shard
+    cursors of a chat are heap-merged in CreateTime order, and a message
+    repeated across shards (same non-zero MesSvrID) is kept once.  A time window
+    is pushed down through plan_shards, so shards and tables outside it are
+    never opened or queried.  With a *state*,
+    only rows past each table's high-water mark are fetched, and the marks
+    advance after the consumer has taken the conversation.  *build* turns
+    one chat's rows into the yielded object (make_record for plain dicts).
+    A *profile* receives the contact and per-table scan timings.
+    """
     db_dir = acc_dir / "DB"
-    contacts = load_contacts(db_dir / "WCDB_Contact.sqlite")
-
-    bucket: dict[str, List[Message]] = {}
-
-    for db_path in db_chain(db_dir):
-        with sqlite3.connect(db_path) as con:
-            for hash_id, chat_tbl in list_chat_tables(con):
-                messages = fetch_messages(db_path, chat_tbl, t_min, t_max)
-                if messages:
-                    bucket.setdefault(hash_id, []).extend(messages)
-
-    conversations: List[Conversation] = []
-    for hash_id, msgs in bucket.items():
-        msgs.sort(key=lambda m: m.timestamp)
-
-        usr_name, nickname = contacts.get(hash_id, ("<unknown>", ""))
-        first_ts = msgs[0].timestamp
-        last_ts = msgs[-1].timestamp
-        conversations.append(
-            Conversation(
-                account_uid=acc_dir.name,
-                usrname=usr_name,
-                nickname=nickname,
-                chat_type=chat_kind(usr_name),
-                messages=msgs,
-                first_ts=first_ts,
-                last_ts=last_ts,
-                message_count=len(msgs),
-            )
-        )
+    contacts = _timed_contacts(db_dir, profile)
+    marks = state.marks(acc_dir.name) if state is not None else {}
+
+    shards: List[sqlite3.Connection] = []
+    try:
+        # hash → [(shard name, shard handle, table, index), …] in shard order
+        layout: dict[str, List[Tuple[str, sqlite3.Connection, str, str | None]]] = {}
+        for db_path, planned in plan_shards(db_dir, t_min, t_max):
+            con = open_ro(db_path)
+            shards.append(con)
+            for hash_id, chat_tbl, index in shard_tables(con, planned):
+                layout.setdefault(hash_id, []).append(
+                    (db_path.name, con, chat_tbl, index)
+                )
+
+        for hash_id, tables in layout.items():
+            keyed = len(tables) > 1      # only a multi-shard chat can repeat
+            sources = [
+                ShardRows(shard_name, con, chat_tbl, t_min, t_max,
+                          marks.get((shard_name, chat_tbl)),
+                          track=state is not None, index=index,
+                          key_sql=dedup_key_sql(con, chat_tbl) if keyed else None,
+                          profile=profile)
+                for shard_name, con, chat_tbl, index in tables
+            ]
+            conv = build(acc_dir.name, hash_id, merge_rows(sources, keyed), contacts)
+            if conv is not None:
+                yield conv
+            _commit_marks(state, acc_dir.name, [
+                (src.shard_name, src.table, src.mark)
+                for src in sources if src.advanced
+            ])
+    finally:
+        for con in shards:
+            con.close()
+
+
+def _submit_account(
+    pool: ProcessPoolExecutor,
+    acc_dir: Path,
+    t_min: float | None,
+    t_max: float | None,
+    state: DumpState | None,
+) -> Tuple[Path, Any, List[Tuple[str, dict[str, Mark], Any]]]:
+    """Queue the contact DB and every planned shard of one account on *pool*."""
+    db_dir = acc_dir / "DB"
+    contacts_fut = pool.submit(load_contacts, db_dir / "WCDB_Contact.sqlite")
+    marks = state.marks(acc_dir.name) if state is not None else {}
+    shard_futs = []
+    for db_path, planned in plan_shards(db_dir, t_min, t_max):
+        shard_marks = {
+            tbl: mark for (shard, tbl), mark in marks.items()
+            if shard == db_path.name
+        }
+        shard_futs.append((
+            db_path.name,
+            shard_marks,
+            pool.submit(extract_shard, db_path, t_min, t_max,
+                        shard_marks, planned, True),
+        ))
+    return acc_dir, contacts_fut, shard_futs
+
+
+def iter_conversations_parallel(
+    accounts: List[Path],
+    t_min: float | None,
+    t_max: float | None,
+    jobs: int,
+    state: DumpState | None = None,
+    build: Builder = make_conversation,
+    profile: Profile | None = None,
+) -> Iterator[Any]:
+    """
+    Same output as iter_conversations, but every (account, shard) pair and
+    every contact DB is extracted in a process pool of *jobs* workers.
+
+    Per-chat rows are heap-merged in the parent in shard order, so the
+    result is identical to the sequential path.  Accounts are queued one
+    at a time: the next account's shards are submitted when the merge of
+    the current one starts, so at most two accounts' rows are held.  A
+    *profile* sees the time spent waiting for each shard (and the
+    contacts) plus its rows and bytes.
+    """
+    accounts = iter(accounts)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        queued = [_submit_account(pool, acc_dir, t_min, t_max, state)
+                  for acc_dir in islice(accounts, 1)]
+        while queued:
+            acc_dir, contacts_fut, shard_futs = queued.pop(0)
+            # keep the workers busy on the next account while this one merges
+            queued.extend(_submit_account(pool, nxt, t_min, t_max, state)
+                          for nxt in islice(accounts, 1))
+
+            bucket: dict[str, List[List[Row]]] = {}
+            advanced: dict[str, List[Tuple[str, str, Mark]]] = {}
+            for shard_name, shard_marks, fut in shard_futs:
+                if profile is not None:
+                    start = perf_counter()
+                    fut.result()
+                    profile.scanned(shard_name, perf_counter() - start)
+                for hash_id, rows in fut.result().items():
+                    bucket.setdefault(hash_id, []).append(rows)
+                    if profile is not None:
+                        entry = profile.table(shard_name, f"Chat_{hash_id}")
+                        entry["rows"] += len(rows)
+                        entry["bytes"] += body_bytes(rows)
+                    if rows and state is not None:
+                        chat_tbl = f"Chat_{hash_id}"
+                        mark = high_water(rows, shard_marks.get(chat_tbl))
+                        advanced.setdefault(hash_id, []).append(
+                            (shard_name, chat_tbl, mark)
+                        )
+            shard_futs.clear()
+
+            if profile is None:
+                contacts = contacts_fut.result()
+            else:
+                with profile.stage("contacts"):
+                    contacts = contacts_fut.result()
+            for hash_id in list(bucket):
+                conv = build(acc_dir.name, hash_id,
+                             merge_rows(bucket.pop(hash_id), keyed=True), contacts)
+                if conv is not None:
+                    yield conv
+                _commit_marks(state, acc_dir.name, advanced.pop(hash_id, []))
+
+
+# ─────────────── stats-only mode ───────────────────────────────
+StatsPart = Tuple[int, int, int, int, int]   # Type, Des, count, min/max CreateTime
+
+
+def table_stats(
+    con: sqlite3.Connection,
+    table: str,
+    t_min: float | None,
+    t_max: float | None,
+) -> List[StatsPart]:
+    """Count and CreateTime range per (Type, Des) of one table – one aggregate query."""
+    where, params = _window_clause(t_min, t_max)
+    return con.execute(
+        f"SELECT Type, Des, count(*), min(CreateTime), max(CreateTime) "
+        f"FROM {table}{where} GROUP BY Type, Des",
+        params,
+    ).fetchall()
+
+
+def _stat_batches(
+    con: sqlite3.Connection,
+    table: str,
+    t_min: float | None,
+    t_max: float | None,
+    key_sql: str,
+) -> Iterator[List[Tuple[int, int, int, Any]]]:
+    """(CreateTime, Des, Type, dedup key) batches in CreateTime order – no bodies."""
+    where, params = _window_clause(t_min, t_max)
+    cur = con.execute(
+        f"SELECT CreateTime, Des, Type, {key_sql} FROM {table}{where} "
+        f"ORDER BY CreateTime, rowid",
+        params,
+    )
+    while True:
+        batch = cur.fetchmany(BATCH_SIZE)
+        if not batch:
+            return
+        yield batch
+
 
-    return conversations
+def ranges_overlap(ranges: Iterable[Tuple[int, int]]) -> bool:
+    """Do any two of the (min, max) CreateTime ranges – one per shard – overlap?"""
+    spans = sorted(ranges)
+    return any(lo <= prev_hi for (_, prev_hi), (lo, _) in zip(spans, spans[1:]))
+
+
+def dedup_parts(
+    tables: List[Tuple[str, sqlite3.Connection, str]],
+    t_min: float | None,
+    t_max: float | None,
+    profile: Profile | None = None,
+) -> Iterator[StatsPart]:
+    """
+    (Type, Des, 1, ts, ts) per message of one chat spread over the
+    (shard name, handle, table) *tables*, with messages repeated across
+    shards counted once (merge_dedup) – reads no message body.
+    """
+    sources = []
+    for shard_name, con, chat_tbl in tables:
+        batches = _stat_batches(con, chat_tbl, t_min, t_max, dedup_key_sql(con, chat_tbl))
+        if profile is not None:
+            batches = profile.scan(shard_name, chat_tbl, batches, count=False)
+        sources.append(chain.from_iterable(batches))
+    return ((msg_type, des, 1, ts, ts) for ts, des, msg_type, _ in merge_dedup(sources, 0, 3))
+
+
+def make_stats(
+    account_uid: str,
+    hash_id: str,
+    parts: Iterable[StatsPart],
+    contacts: dict[str, Tuple[str, str]],
+) -> dict | None:
+    """Per-chat statistics record from merged (Type, Des, count, min, max) parts."""
+    count = incoming = outgoing = 0
+    first = last = None
+    types: Dict[int, int] = {}
+    for msg_type, des, n, lo, hi in parts:
+        count += n
+        if des == 1:
+            outgoing += n
+        else:
+            incoming += n
+        types[msg_type] = types.get(msg_type, 0) + n
+        first = lo if first is None else min(first, lo)
+        last = hi if last is None else max(last, hi)
+    if not count:
+        return None
+    record = _chat_header(account_uid, hash_id, contacts)
+    record.update(
+        chat_hash=hash_id,
+        first_ts=utc_iso_fast(first),
+        last_ts=utc_iso_fast(last),
+        message_count=count,
+        incoming=incoming,
+        outgoing=outgoing,
+        types={str(t): types[t] for t in sorted(types)},
+    )
+    return record
+
+
+def iter_chat_stats(
+    acc_dir: Path,
+    t_min: float | None,
+    t_max: float | None,
+    profile: Profile | None = None,
+) -> Iterator[dict]:
+    """
+    Yield one statistics record per chat (see make_stats), in the order of
+    iter_conversations, without reading a message body: every table is
+    summarised by a GROUP BY inside its shard and the parts are added up.
+    Only a chat whose shards overlap in time can hold cross-shard
+    duplicates; it is counted from its (CreateTime, Des, Type, key)
+    columns through dedup_parts instead.  A *profile* times each aggregate.
+    """
+    db_dir = acc_dir / "DB"
+    contacts = _timed_contacts(db_dir, profile)
+    shards: List[sqlite3.Connection] = []
+    try:
+        # hash → [(shard name, shard handle, table, parts), …] in shard order
+        layout: dict[str, List[Tuple[str, sqlite3.Connection, str, List[StatsPart]]]] = {}
+        for db_path, planned in plan_shards(db_dir, t_min, t_max):
+            con = open_ro(db_path)
+            shards.append(con)
+            for hash_id, chat_tbl, _ in shard_tables(con, planned):
+                start = perf_counter() if profile is not None else 0.0
+                parts = table_stats(con, chat_tbl, t_min, t_max)
+                if profile is not None:
+                    elapsed = perf_counter() - start
+                    entry = profile.table(db_path.name, chat_tbl)
+                    entry["seconds"] += elapsed
+                    entry["rows"] += sum(part[2] for part in parts)
+                    profile.scanned(db_path.name, elapsed)
+                if parts:
+                    layout.setdefault(hash_id, []).append(
+                        (db_path.name, con, chat_tbl, parts)
+                    )
+
+        for hash_id, tables in layout.items():
+            if len(tables) > 1 and ranges_overlap(
+                    (min(p[3] for p in parts), max(p[4] for p in parts))
+                    for *_, parts in tables):
+                merged = dedup_parts([table[:3] for table in tables], t_min, t_max, profile)
+            else:
+                merged = [part for *_, parts in tables for part in parts]
+            record = make_stats(acc_dir.name, hash_id, merged, contacts)
+            if record is not None:
+                yield record
+    finally:
+        for con in shards:
+            con.close()
+
+
+def build_conversations(
+    acc_dir: Path,
+    t_min: float | None,
+    t_max: float | None,
+) -> List[Conversation]:
+    return list(iter_conversations(acc_dir, t_min, t_max))
 
 
 # ─────────────────────────── CLI ───────────────────────────────
 @click.command(context_settings={"help_option_names": ["-h", "--help"]})
 @click.argument("root", type=click.Path(path_type=Path, exists=True))
-@click.option("-o", "--out-file", type=click.Path(path_type=Path), default="dump.json")
+@click.option("-o", "--out-file", type=click.Path(path_type=Path),
+              help="Output file (default dump.json; dump.parquet/ directory for parquet)")
 @click.option("--from-date")
 @click.option("--to-date")
 @click.option("--last-days", type=int)
 @click.option("--last-hours", type=int)
+@click.option("--format", "out_format", type=click.Choice(sorted(WRITERS)),
+              default="json", show_default=True,
+              help="json = pretty array, ndjson = one compact conversation per line, "
+                   "parquet = dataset partitioned by account/chat_kind (needs pyarrow)")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Extract shards/accounts in a pool of N processes")
+@click.option("--state", "state_file", type=click.Path(path_type=Path),
+              help="Incremental mode: append only rows newer than the marks in this file")
+@click.option("--stats", "stats_only", is_flag=True,
+              help="Per-chat counts, first/last time, in/out and Type histogram only "
+                   "(SQL aggregates, no message bodies)")
+@click.option("--rediscover", is_flag=True,
+              help="Ignore the cached account list and search the backup again")
+@click.option("--profile", "profile_file", type=click.Path(path_type=Path),
+              help="Write per-stage timings and per-table rows/bytes as JSON to this file")
+@click.option("--profile-cpu", "cpu_file", type=click.Path(path_type=Path),
+              help="Also run under cProfile and dump its stats here (pstats format)")
 def cli(
     root: Path,
-    out_file: Path,
+    out_file: Path | None,
     from_date: str | None,
     to_date: str | None,
     last_days: int | None,
     last_hours: int | None,
+    out_format: str,
+    jobs: int,
+    state_file: Path | None,
+    stats_only: bool,
+    rediscover: bool,
+    profile_file: Path | None,
+    cpu_file: Path | None,
 ) -> None:
     """
     Export WeChat chats to JSON.
 
     • Use --last-hours or --last-days for relative windows.
     • Use --from-date / --to-date for absolute local-time windows.
+    • Conversations are streamed to disk one at a time (--format ndjson
+      for compact line-delimited output).
+    • --jobs N extracts shards in parallel (holds at most two accounts
+      in memory).
+    • --state FILE appends only new rows to an ndjson OUT_FILE; re-run to
+      resume an interrupted dump.
+    • --format parquet writes raw CreateTime/body columns in row groups,
+      one directory per account and chat kind.
+    • --stats writes one summary per chat instead of its messages, e.g.
+      --stats --last-days 7 for the chats active this week.
+    • --profile REPORT.json records where the time went (discovery,
+      contacts, per-shard scans, serialisation, writes); --profile-cpu
+      adds a cProfile dump for snakeviz / pstats.
     """
     relative_count = sum(
         item is not None for item in (last_days, last_hours)
@@ -240,18 +875,86 @@ def cli(
     if relative_count and (from_date or to_date):
         raise click.UsageError("Relative and absolute windows cannot mix")
 
-    t_min, t_max = build_window(from_date, to_date, last_days, last_hours)
+    if state_file and out_format != "ndjson":
+        raise click.UsageError("--state requires --format ndjson (output is appended)")
 
-    all_conversations: List[Conversation] = []
-    for account in scan_accounts(root.expanduser().resolve()):
-        all_conversations.extend(build_conversations(account, t_min, t_max))
+    if stats_only and (state_file or out_format == "parquet"):
+        raise click.UsageError("--stats writes json/ndjson summaries and has no --state")
 
-    with open(out_file, "w", encoding="utf-8") as fh:
-        json.dump([asdict(conv) for conv in all_conversations], fh,
-                  ensure_ascii=False, indent=2)
+    if stats_only and jobs > 1:
+        raise click.UsageError("--stats runs SQL aggregates in one process; drop --jobs")
 
-    click.echo(f"✅ Dumped {len(all_conversations)} conversations to {out_file}")
+    t_min, t_max = build_window(from_date, to_date, last_days, last_hours)
 
+    columnar = out_format == "parquet"
+    if columnar:
+        try:
+            parquet_schema()
+        except RuntimeError as exc:
+            raise click.UsageError(str(exc))
+    if out_file is None:
+        out_file = Path("dump.parquet" if columnar else "dump.json")
+
+    profile = Profile() if profile_file else None
+    cpu = cProfile.Profile() if cpu_file else None
+    if cpu is not None:
+        cpu.enable()
+
+    state = DumpState(state_file) if state_file else None
+    if state is not None and out_file.is_file():
+        committed = state.committed_size(out_file)
+        if committed is not None and out_file.stat().st_size > committed:
+            os.truncate(out_file, committed)    # tail of an interrupted run
+    start = perf_counter()
+    accounts = scan_accounts(root.expanduser().resolve(), rediscover)
+    if profile is not None:
+        profile.add("discovery", perf_counter() - start)
+    if stats_only:                  # aggregates only – cheap enough for one process
+        conversations = (
+            record
+            for account in accounts
+            for record in iter_chat_stats(account, t_min, t_max, profile)
+        )
+    elif jobs > 1:
+        conversations = iter_conversations_parallel(
+            accounts, t_min, t_max, jobs, state,
+            build=make_rows if columnar else make_record, profile=profile,
+        )
+    else:
+        conversations = (
+            conv
+            for account in accounts
+            for conv in iter_conversations(account, t_min, t_max, state,
+                                           build=make_rows if columnar else make_stream,
+                                           profile=profile)
+        )
+
+    try:
+        with open_writer(out_format, out_file, append=state is not None,
+                         profile=profile) as writer:
+            start = perf_counter()
+            for conv in conversations:
+                writer.write(conv)
+                if state is not None:
+                    writer.flush()   # on disk before the marks advance
+                    state.written(out_file, writer.size())
+            if profile is not None:
+                profile.add("dump", perf_counter() - start)
+    finally:
+        if state is not None:
+            state.close()
+        if cpu is not None:
+            cpu.disable()
+            cpu.dump_stats(cpu_file)
+
+    if profile is not None:
+        profile.conversations = writer.count
+        profile.bytes_written = (
+            sum(p.stat().st_size for p in out_file.rglob("*") if p.is_file())
+            if out_file.is_dir() else out_file.stat().st_size
+        )
+        profile.write(profile_file)
+    click.echo(f"✅ Dumped {writer.count} conversations to {out_file}")
 
 if __name__ == "__main__":
     cli()
@@ -5,9 +5,10 @@ import argparse
 import random
 import sqlite3
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from mimesis import Person, Text
 from mimesis.enums import Gender
@@ -21,6 +22,18 @@ TEXT = Text("en")
 
 
 # ───────────────────────── tiny helpers ─────────────────────── #
+def seed(value: int) -> None:
+    """Seed `random` and the mimesis providers – same seed, same names and text."""
+    random.seed(value)
+    PERSON.reseed(value)
+    TEXT.reseed(value)
+
+
+def random_uuid() -> uuid.UUID:
+    """A version-4 UUID drawn from `random`, so seed() covers it too."""
+    return uuid.UUID(int=random.getrandbits(128), version=4)
+
+
 def rand_ts(within_days: int) -> int:
     """Unix-epoch seconds somewhere in the last <within_days> days."""
     offset = random.randint(0, within_days * 86_400)
@@ -31,7 +44,7 @@ def contacts_list(n: int) -> List[Tuple[str, str]]:
     """[(UsrName, Nickname), …]"""
     res = []
     for _ in range(n):
-        usr = f"wxid_{uuid.uuid4().hex[:12]}"
+        usr = f"wxid_{random_uuid().hex[:12]}"
         nick = PERSON.full_name(gender=random.choice([Gender.MALE, Gender.FEMALE]))
         res.append((usr, nick))
     return res
@@ -113,6 +126,92 @@ def make_slice(
         con.commit()
 
 
+# ───────────────────────── fast mode ────────────────────────── #
+FAST_BATCH = 50_000            # rows per executemany
+TEXT_POOL_SIZE = 2_000         # pre-generated sentences
+EMOJI_TAILS = (" 🙂", " 🤔", "")
+
+FAST_CHAT_SQL = """
+CREATE TABLE {chat}(
+  CreateTime INTEGER,
+  Des        INTEGER,
+  Type       INTEGER,
+  Message    TEXT,
+  MesLocalID INTEGER PRIMARY KEY AUTOINCREMENT
+);
+CREATE TABLE {ext}(
+  MesLocalID INTEGER PRIMARY KEY,
+  msgFlag    INTEGER DEFAULT 0,
+  MsgSource  TEXT,
+  MsgIdentify TEXT
+);
+"""
+
+
+def text_pool(size: int = TEXT_POOL_SIZE) -> List[str]:
+    """Pre-generated type-1 bodies – one mimesis call per pool entry, not per row."""
+    return [TEXT.sentence() + random.choice(EMOJI_TAILS) for _ in range(size)]
+
+
+def make_slice_fast(
+    db_path: Path,
+    contacts: List[Tuple[str, str]],
+    msgs_each: int,
+    slice_idx: int,
+    pool: List[str],
+    seed: Optional[int] = None,
+) -> None:
+    """
+    make_slice for large containers: journal/sync off, one transaction,
+    executemany in FAST_BATCH chunks, bodies drawn from *pool*.
+
+    Rows get explicit MesLocalIDs in CreateTime order (as on a real
+    device), and every Chat_<hash> keeps its INTEGER PRIMARY KEY.
+    """
+    rng = random.Random(seed)
+    now_ts = int(NOW.timestamp())
+    span = (10 + slice_idx * 5) * 86_400      # stagger per slice, as make_slice
+    fixed = {3: "<img src='qpic://123'/>", 34: "<voice len='3s'/>"}
+
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("PRAGMA cache_size=-65536")       # 64 MiB
+        con.execute("BEGIN")
+        for usr, _ in contacts:
+            h = md5_hex(usr)
+            chat = f"Chat_{h}"
+            ext = f"ChatExt2_{h}"
+            # executescript() would COMMIT – keep everything in one transaction
+            for stmt in FAST_CHAT_SQL.format(chat=chat, ext=ext).split(";"):
+                if stmt.strip():
+                    con.execute(stmt)
+
+            # column-wise draws – rng.choices/random() instead of per-row randint
+            draw = rng.random
+            stamps = sorted([now_ts - int(draw() * span) for _ in range(msgs_each)])
+            types = rng.choices((1, 1, 1, 3, 34), k=msgs_each)
+            dirs = rng.choices((0, 1), k=msgs_each)
+            texts = rng.choices(pool, k=msgs_each)
+            bodies = [fixed.get(tp) or text for tp, text in zip(types, texts)]
+            rows = list(zip(stamps, dirs, types, bodies, range(1, msgs_each + 1)))
+            for start in range(0, msgs_each, FAST_BATCH):
+                con.executemany(
+                    f"INSERT INTO {chat}(CreateTime,Des,Type,Message,MesLocalID) "
+                    "VALUES (?,?,?,?,?)",
+                    rows[start:start + FAST_BATCH],
+                )
+            # matching ChatExt2_<hash> rows straight from SQL
+            con.execute(
+                f"INSERT INTO {ext}(MesLocalID,msgFlag,MsgSource) "
+                f"SELECT MesLocalID, 0, '<src>mockgen</src>' FROM {chat}"
+            )
+        con.commit()
+    finally:
+        con.close()
+
+
 # ────────────────── container-level builder ─────────────────── #
 def build_container(
     root: Path,
@@ -120,14 +219,24 @@ def build_container(
     contacts_n: int,
     messages_n: int,
     slices_n: int,
+    fast: bool = False,
+    jobs: int = 1,
 ) -> None:
     """
     Create a complete fake WeChat-for-iOS container under *root*.
+
+    *fast* switches to make_slice_fast; with *jobs* > 1 its slices are
+    built in a process pool.  Account folders, contacts and per-slice seeds
+    are drawn from `random`, so seed() before the call makes the container
+    reproducible (timestamps stay relative to the current time).
     """
     docs = root / "AppDomain-com.tencent.xin" / "Documents"
+    pool = text_pool() if fast else []
+    executor = ProcessPoolExecutor(max_workers=jobs) if fast and jobs > 1 else None
+    futures = []
 
     for _ in range(accounts):
-        acc_dir = docs / uuid.uuid4().hex
+        acc_dir = docs / random_uuid().hex
         db_dir = acc_dir / "DB"
         db_dir.mkdir(parents=True, exist_ok=True)
 
@@ -148,12 +257,20 @@ def build_container(
 
         # message slices
         for n in range(1, slices_n + 1):
-            make_slice(
-                db_dir / f"message_{n}.sqlite",
-                contacts,
-                messages_n,
-                n,
-            )
+            db_path = db_dir / f"message_{n}.sqlite"
+            if not fast:
+                make_slice(db_path, contacts, messages_n, n)
+                continue
+            args = (db_path, contacts, messages_n, n, pool, random.getrandbits(32))
+            if executor is None:
+                make_slice_fast(*args)
+            else:
+                futures.append(executor.submit(make_slice_fast, *args))
+
+    if executor is not None:
+        with executor:
+            for fut in futures:
+                fut.result()
 
 
 # ───────────────────────────── CLI ──────────────────────────── #
@@ -166,14 +283,23 @@ def cli() -> None:
     parser.add_argument("--contacts", type=int, default=5)
     parser.add_argument("--messages", type=int, default=20)
     parser.add_argument("--slices", type=int, default=2)
+    parser.add_argument("--fast", action="store_true",
+                        help="Batched inserts, journal off, pre-generated text")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Build slices in N processes (with --fast)")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible data")
     args = parser.parse_args()
 
+    if args.seed is not None:
+        seed(args.seed)
     build_container(
         args.dest,
         accounts=args.accounts,
         contacts_n=args.contacts,
         messages_n=args.messages,
         slices_n=args.slices,
+        fast=args.fast,
+        jobs=args.jobs,
     )
     print(f"✅ Mock WeChat backup written to: {args.dest.resolve()}")
 
@@ -0,0 +1,187 @@
+"""
+wechat_utils.paging  –  keyset pagination over one conversation
+
+read_page() returns "the next N messages of chat X" without reading what
+comes before them: every shard's Chat_<hash> table is entered with a seek
+on (CreateTime, rowid) past the continuation key and read lazily, and the
+shards are heap-merged in the dump's order.  Memory is bounded by the
+page, not by the chat.
+
+Messages are ordered by (CreateTime, shard, MesLocalID) – MesLocalID is
+the table's INTEGER PRIMARY KEY, so the seek uses rowid, which also covers
+tables whose MesLocalID column was left NULL.  The continuation token
+encodes that key plus the duplicate keys already returned for its second,
+so a message repeated in a later shard (see catalog.merge_dedup) is still
+returned once across page boundaries.
+"""
+from __future__ import annotations
+
+import base64
+import heapq
+import json
+import sqlite3
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from ._helpers import md5_hex, open_ro
+from .catalog import Span, dedup_key_sql, load_catalog, shard_chain
+from .dump import BATCH_SIZE, message_dicts
+
+TOKEN_VERSION = 1
+MAX_PAGE = 10_000
+
+PageKey = Tuple[int, int, int]          # CreateTime, shard position, rowid
+
+
+class Page(NamedTuple):
+    chat: str                           # chat hash
+    messages: List[dict]
+    next_token: Optional[str]           # None → no further messages
+
+
+# ───────────────────────── token ────────────────────────────── #
+def encode_token(chat: str, key: PageKey, seen: List) -> str:
+    raw = json.dumps([TOKEN_VERSION, chat, *key, seen], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_token(token: str, chat: str) -> Tuple[PageKey, List]:
+    """Key and same-second duplicate keys of *token*; ValueError if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        version, token_chat, ts, pos, rowid, seen = json.loads(raw)
+        key = (int(ts), int(pos), int(rowid))
+        if not isinstance(seen, list):
+            raise TypeError("seen keys")
+    except (ValueError, TypeError, OverflowError) as exc:
+        raise ValueError("malformed page token") from exc
+    if version != TOKEN_VERSION or token_chat != chat:
+        raise ValueError("page token belongs to another chat or version")
+    return key, seen
+
+
+# ───────────────────────── reader ───────────────────────────── #
+def seek_rows(
+    con: sqlite3.Connection,
+    table: str,
+    pos: int,
+    after: PageKey | None,
+    key_sql: str | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[tuple]:
+    """
+    (CreateTime, pos, rowid, Des, Type, Message, MesLocalID[, key]) rows of
+    one table past *after*, in (CreateTime, rowid) order, read lazily.
+    """
+    clauses = ""
+    params: List[int] = []
+    if after is not None:
+        ts, after_pos, rowid = after
+        if pos < after_pos:
+            clauses = " WHERE CreateTime > ?"
+            params = [ts]
+        elif pos == after_pos:
+            clauses = " WHERE (CreateTime, rowid) > (?, ?)"
+            params = [ts, rowid]
+        else:
+            clauses = " WHERE CreateTime >= ?"
+            params = [ts]
+    key = f", {key_sql}" if key_sql else ""
+    cur = con.execute(
+        f"SELECT CreateTime, {pos}, rowid, Des, Type, Message, MesLocalID{key} "
+        f"FROM {table}{clauses} ORDER BY CreateTime, rowid",
+        params,
+    )
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
+
+
+def read_page(
+    acc_dir: Path,
+    chat: str,
+    limit: int = 500,
+    token: str | None = None,
+    cons: Mapping[str, sqlite3.Connection] | None = None,
+    catalog: Mapping[str, Mapping[str, Span]] | None = None,
+) -> Page:
+    """
+    Up to *limit* messages of *chat* (hash or UsrName) in *acc_dir*,
+    starting after *token* (None: from the first message).  *cons* maps
+    shard file names to open handles to reuse (e.g. a warm service);
+    shards missing from it are opened and closed here.  *catalog* is the
+    account's load_catalog() result, in shard order, if the caller holds
+    it; otherwise it is loaded (from the in-process cache after the first
+    page).
+    """
+    if not 1 <= limit <= MAX_PAGE:
+        raise ValueError(f"limit must be 1..{MAX_PAGE}")
+    db_dir = acc_dir / "DB"
+    if catalog is None:
+        catalog = load_catalog(db_dir, shard_chain(db_dir))
+    table = f"Chat_{chat}"
+    if not any(table in tables for tables in catalog.values()):
+        usr_hash = md5_hex(chat)
+        table = f"Chat_{usr_hash}"
+        chat = usr_hash
+    after, seen = decode_token(token, chat) if token else (None, [])
+
+    parts = []                          # (position, shard name)
+    for pos, (name, tables) in enumerate(catalog.items()):
+        span = tables.get(table)
+        if span is None or not span.rows:
+            continue
+        if after is not None and span.max_ts < after[0]:
+            continue                    # shard ends before the page starts
+        parts.append((pos, name))
+    if not parts:
+        return Page(chat, [], None)
+
+    cons = dict(cons or {})
+    opened: Dict[str, sqlite3.Connection] = {}
+    try:
+        keyed = len(parts) > 1
+        streams = []
+        for pos, name in parts:
+            con = cons.get(name)
+            if con is None:
+                con = opened[name] = open_ro(db_dir / name)
+            key_sql = dedup_key_sql(con, table) if keyed else None
+            streams.append(seek_rows(con, table, pos, after, key_sql,
+                                     min(limit + 1, BATCH_SIZE)))
+        merged = streams[0] if len(streams) == 1 else heapq.merge(
+            *streams, key=itemgetter(0, 1, 2))
+
+        rows: List[tuple] = []
+        current = after[0] if after else None
+        seen_now = set(seen)            # dedup keys returned in second *current*
+        last_seen = seen_now            # … in the second of the last page row
+        more = False
+        for row in merged:
+            if row[0] != current:
+                current = row[0]
+                seen_now = set()
+            key = row[7] if keyed else None
+            if key is not None and key in seen_now:
+                continue
+            if len(rows) == limit:
+                more = True
+                break
+            if key is not None:
+                seen_now.add(key)
+            last_seen = seen_now
+            rows.append(row)
+    finally:
+        for con in opened.values():
+            con.close()
+
+    next_token = None
+    if more:
+        last = rows[-1]
+        next_token = encode_token(chat, (last[0], last[1], last[2]), sorted(last_seen))
+    msgs = message_dicts([(r[0], r[3], r[4], r[5], r[6]) for r in rows]) if rows else []
+    return Page(chat, msgs, next_token)
+
@@ -0,0 +1,157 @@
+"""
+wechat_utils.profiling  –  per-stage timings for wechat-dump --profile
+
+A Profile collects wall-clock seconds per stage (discovery, contacts, scan,
+serialize, write) plus, per shard and Chat_ table, the scan time and the
+rows and body bytes read.  The dump only touches it where a Profile was
+passed in, so without --profile nothing is measured.
+
+Rows are pulled lazily while the writer consumes a conversation, so scan
+and serialisation interleave inside writer.write(); "write" is the time
+spent in the output file's write() calls and "serialize" is what remains
+of the dump loop once contacts, scan and write are taken out.
+"""
+from __future__ import annotations
+
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List
+
+REPORT_VERSION = 1
+
+
+def body_bytes(rows: Iterable[tuple], column: int = 3) -> int:
+    """UTF-8 size of the Message column of *rows*."""
+    size = 0
+    for row in rows:
+        body = row[column]
+        if isinstance(body, bytes):
+            size += len(body)
+        elif body is not None:
+            size += len(body.encode("utf-8"))
+    return size
+
+
+class Profile:
+    """Stage timings and per-table counters of one dump run."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self.shards: Dict[str, Dict[str, Any]] = {}    # name → seconds, tables
+        self.bytes_written = 0
+        self.conversations = 0
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def shard(self, name: str) -> Dict[str, Any]:
+        entry = self.shards.get(name)
+        if entry is None:
+            entry = self.shards[name] = {"seconds": 0.0, "tables": {}}
+        return entry
+
+    def table(self, shard: str, table: str) -> Dict[str, float]:
+        tables = self.shard(shard)["tables"]
+        entry = tables.get(table)
+        if entry is None:
+            entry = tables[table] = {"seconds": 0.0, "rows": 0, "bytes": 0}
+        return entry
+
+    def scanned(self, shard: str, seconds: float) -> None:
+        """Scan time of a shard read as a whole (e.g. in a worker process)."""
+        self.shard(shard)["seconds"] += seconds
+        self.add("scan", seconds)
+
+    def scan(
+        self,
+        shard: str,
+        table: str,
+        batches: Iterable[List[tuple]],
+        body_column: int | None = 3,
+        count: bool = True,
+    ) -> Iterator[List[tuple]]:
+        """
+        Pass *batches* through, timing each fetch and – unless *count* is
+        off (rows already counted) – counting rows and *body_column* bytes.
+        """
+        entry = self.table(shard, table)
+        batches = iter(batches)
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            elapsed = time.perf_counter() - start
+            entry["seconds"] += elapsed
+            self.scanned(shard, elapsed)
+            if batch is None:
+                return
+            if count:
+                entry["rows"] += len(batch)
+                if body_column is not None:
+                    entry["bytes"] += body_bytes(batch, body_column)
+            yield batch
+
+    def wrap_file(self, fh: IO[str]) -> "TimedFile":
+        return TimedFile(fh, self)
+
+    def report(self) -> Dict[str, Any]:
+        stages = dict(self.stages)
+        # contacts, scan and file writes all run inside the dump loop
+        inside = stages.pop("dump", 0.0)
+        stages["serialize"] = max(inside - stages.get("contacts", 0.0)
+                                  - stages.get("scan", 0.0)
+                                  - stages.get("write", 0.0), 0.0)
+        total = time.perf_counter() - self._start
+        tables = [t for shard in self.shards.values() for t in shard["tables"].values()]
+        rows = sum(t["rows"] for t in tables)
+        return {
+            "version": REPORT_VERSION,
+            "total_seconds": round(total, 4),
+            "stages": {name: round(sec, 4) for name, sec in sorted(stages.items())},
+            "conversations": self.conversations,
+            "rows": rows,
+            "bytes_read": sum(t["bytes"] for t in tables),
+            "bytes_written": self.bytes_written,
+            "rows_per_sec": round(rows / total) if total else 0,
+            "shards": {
+                name: {
+                    "seconds": round(shard["seconds"], 4),
+                    "rows": sum(t["rows"] for t in shard["tables"].values()),
+                    "tables": {
+                        table: {**t, "seconds": round(t["seconds"], 4)}
+                        for table, t in shard["tables"].items()
+                    },
+                }
+                for name, shard in self.shards.items()
+            },
+        }
+
+    def write(self, path: Path) -> None:
+        Path(path).write_text(json.dumps(self.report(), indent=2) + "\n", encoding="utf-8")
+
+
+class TimedFile:
+    """File proxy that times write()."""
+
+    def __init__(self, fh: IO[str], profile: Profile) -> None:
+        self._fh = fh
+        self._profile = profile
+
+    def write(self, text: str) -> int:
+        start = time.perf_counter()
+        n = self._fh.write(text)
+        self._profile.add("write", time.perf_counter() - start)
+        return n
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._fh, name)
@@ -0,0 +1,221 @@
+"""
+wechat_utils.search  –  SQLite FTS5 full-text index over WeChat backups
+
+wechat-index ROOT -i INDEX  reads every account like wechat-dump and adds
+the decoded message bodies to an FTS5 table, together with account, chat
+and CreateTime columns.  The index file also holds the dump's high-water
+marks (see .state), so a re-run only adds rows that arrived since; index
+rows and marks are committed in the same transaction.
+
+wechat-search INDEX QUERY  returns bm25-ranked hits with a snippet around
+each match.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import click
+
+from ._helpers import utc_iso_fast
+from .dump import build_window, iter_conversations, make_rows, scan_accounts
+from .state import DumpState
+
+TEXT_TYPES = (1,)              # plain text; media bodies are XML/paths
+
+FTS_COLUMNS = (
+    "body", "account", "chat", "usrname", "create_time",
+    "direction", "msg_type", "mes_local_id",
+)
+
+
+def fts_schema(tokenize: str) -> str:
+    unindexed = ", ".join(f"{col} UNINDEXED" for col in FTS_COLUMNS[1:])
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        f"body, {unindexed}, tokenize='{tokenize}')"
+    )
+
+
+def default_tokenizer() -> str:
+    """trigram (substring matches, CJK-friendly) where SQLite has it."""
+    con = sqlite3.connect(":memory:")
+    try:
+        con.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        return "trigram"
+    except sqlite3.OperationalError:
+        return "unicode61"
+    finally:
+        con.close()
+
+
+def decode_body(value: Any) -> str:
+    """Message column → text: zlib-inflated if needed, \\x02 markers dropped."""
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        if value[:1] == b"x":
+            try:
+                value = zlib.decompress(value)
+            except zlib.error:
+                pass
+        value = value.decode("utf-8", "replace")
+    return value.replace("\x02", "")
+
+
+# ───────────────────────── indexing ─────────────────────────── #
+def build_index(
+    root: Path,
+    index_path: Path,
+    types: Tuple[int, ...] | None = TEXT_TYPES,
+    tokenize: str | None = None,
+) -> int:
+    """
+    Add every message past the stored marks to the index; returns the number
+    of rows added.  *types* None indexes every message type.
+    """
+    added = 0
+    with DumpState(index_path) as state:
+        con = state.con                 # same connection → one transaction
+        con.execute(fts_schema(tokenize or default_tokenizer()))
+        insert = (
+            f"INSERT INTO messages_fts({', '.join(FTS_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(FTS_COLUMNS))})"
+        )
+        for acc_dir in scan_accounts(root):
+            for chat in iter_conversations(acc_dir, None, None, state, build=make_rows):
+                head = chat.header
+                for batch in chat:
+                    params = [
+                        (decode_body(body), head["account_uid"], head["chat_hash"],
+                         head["usrname"], ts, "out" if des == 1 else "in",
+                         msg_type, mes_id)
+                        for ts, des, msg_type, body, mes_id in batch
+                        if types is None or msg_type in types
+                    ]
+                    con.executemany(insert, params)
+                    added += len(params)
+                # iter_conversations advances the marks and commits both
+    return added
+
+
+# ───────────────────────── searching ────────────────────────── #
+def fts_query(text: str) -> str:
+    """Plain words → an AND of quoted FTS5 phrases (no query syntax needed)."""
+    terms = text.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search(
+    index_path: Path,
+    query: str,
+    limit: int = 20,
+    account: str | None = None,
+    chat: str | None = None,
+    t_min: float | None = None,
+    t_max: float | None = None,
+    raw: bool = False,
+) -> List[Dict[str, Any]]:
+    """bm25-ranked hits for *query*, best first, each with a snippet."""
+    clauses = ["messages_fts MATCH ?"]
+    params: List[Any] = [query if raw else fts_query(query)]
+    if account is not None:
+        clauses.append("account = ?")
+        params.append(account)
+    if chat is not None:
+        clauses.append("(chat = ? OR usrname = ?)")
+        params.extend((chat, chat))
+    if t_min is not None:
+        clauses.append("create_time >= ?")
+        params.append(int(t_min))
+    if t_max is not None:
+        clauses.append("create_time <= ?")
+        params.append(int(t_max))
+    params.append(limit)
+
+    con = sqlite3.connect(f"{Path(index_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = con.execute(
+            "SELECT bm25(messages_fts), account, chat, usrname, create_time, "
+            "direction, msg_type, mes_local_id, "
+            "snippet(messages_fts, 0, '[', ']', '…', 48) "
+            f"FROM messages_fts WHERE {' AND '.join(clauses)} "
+            "ORDER BY bm25(messages_fts) LIMIT ?",
+            params,
+        ).fetchall()
+    finally:
+        con.close()
+    return [
+        {
+            "score": round(-rank, 4),
+            "account_uid": acc,
+            "chat": chat_hash,
+            "usrname": usr,
+            "timestamp": utc_iso_fast(ts),
+            "direction": direction,
+            "msg_type": msg_type,
+            "mes_local_id": mes_id,
+            "snippet": snippet,
+        }
+        for rank, acc, chat_hash, usr, ts, direction, msg_type, mes_id, snippet in rows
+    ]
+
+
+# ─────────────────────────── CLI ───────────────────────────────
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument("root", type=click.Path(path_type=Path, exists=True))
+@click.option("-i", "--index", "index_path", type=click.Path(path_type=Path),
+              default="wechat_index.db", show_default=True)
+@click.option("--all-types", is_flag=True, help="Index every message type, not only text")
+@click.option("--tokenize", help="FTS5 tokenizer for a new index (default: trigram if available)")
+def index_cli(root: Path, index_path: Path, all_types: bool, tokenize: str | None) -> None:
+    """
+    Build or update a full-text index of WeChat messages.
+
+    Re-running only adds messages newer than the previous run.
+    """
+    added = build_index(root.expanduser().resolve(), index_path,
+                        None if all_types else TEXT_TYPES, tokenize)
+    click.echo(f"✅ Indexed {added} new messages into {index_path}")
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument("index_path", type=click.Path(path_type=Path, exists=True))
+@click.argument("query")
+@click.option("-n", "--limit", type=int, default=20, show_default=True)
+@click.option("--account", help="Only this account UID")
+@click.option("--chat", help="Only this chat (hash or UsrName)")
+@click.option("--from-date")
+@click.option("--to-date")
+@click.option("--raw", is_flag=True, help="QUERY is FTS5 syntax (NEAR, OR, prefix*) as is")
+@click.option("--json", "as_json", is_flag=True, help="One JSON hit per line")
+def search_cli(
+    index_path: Path,
+    query: str,
+    limit: int,
+    account: str | None,
+    chat: str | None,
+    from_date: str | None,
+    to_date: str | None,
+    raw: bool,
+    as_json: bool,
+) -> None:
+    """Ranked full-text search over an index built by wechat-index."""
+    t_min, t_max = build_window(from_date, to_date, None, None)
+    try:
+        hits = search(index_path, query, limit, account, chat, t_min, t_max, raw)
+    except sqlite3.OperationalError as exc:       # bad --raw syntax, short trigram query
+        raise click.UsageError(f"search failed: {exc}")
+    for hit in hits:
+        if as_json:
+            click.echo(json.dumps(hit, ensure_ascii=False))
+        else:
+            click.echo(f"{hit['timestamp']}  {hit['usrname']:<24} "
+                       f"{hit['direction']:<3} {hit['snippet']}")
+
+
+if __name__ == "__main__":
+    index_cli()
@@ -0,0 +1,94 @@
+"""
+wechat_utils.state  –  high-water marks for incremental / resumable dumps
+
+One row per (account, shard, Chat_<hash>) holding the largest MesLocalID
+and CreateTime already exported.  Marks are committed after every
+conversation is written, so an interrupted run resumes where it stopped.
+The output file's size is committed in the same transaction: a resumed
+run first truncates whatever a killed run wrote past it.
+"""
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+Mark = Tuple[Optional[int], Optional[int]]   # (MesLocalID, CreateTime)
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS hwm(
+  account     TEXT,
+  shard       TEXT,
+  chat_table  TEXT,
+  mes_local_id INTEGER,
+  create_time  INTEGER,
+  PRIMARY KEY (account, shard, chat_table)
+);
+CREATE TABLE IF NOT EXISTS output(
+  path TEXT PRIMARY KEY,
+  size INTEGER
+);
+"""
+
+
+def high_water(rows: Iterable[tuple], previous: Mark | None = None) -> Mark:
+    """Max (MesLocalID, CreateTime) over raw dump rows, folded into *previous*."""
+    max_id, max_ts = previous if previous else (None, None)
+    for row in rows:
+        ts, mes_id = row[0], row[4]
+        if mes_id is not None and (max_id is None or mes_id > max_id):
+            max_id = mes_id
+        if ts is not None and (max_ts is None or ts > max_ts):
+            max_ts = ts
+    return max_id, max_ts
+
+
+class DumpState:
+    """SQLite-backed store of per-table high-water marks."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.con = sqlite3.connect(self.path)
+        self.con.executescript(SCHEMA_SQL)
+
+    def marks(self, account: str) -> Dict[Tuple[str, str], Mark]:
+        """{(shard, chat_table): (MesLocalID, CreateTime)} for one account."""
+        rows = self.con.execute(
+            "SELECT shard, chat_table, mes_local_id, create_time "
+            "FROM hwm WHERE account = ?",
+            (account,),
+        )
+        return {(shard, tbl): (mes_id, ts) for shard, tbl, mes_id, ts in rows}
+
+    def advance(self, account: str, shard: str, chat_table: str, mark: Mark) -> None:
+        self.con.execute(
+            "INSERT OR REPLACE INTO hwm VALUES (?,?,?,?,?)",
+            (account, shard, chat_table, *mark),
+        )
+
+    def committed_size(self, out_file: Path) -> Optional[int]:
+        """Bytes of *out_file* covered by the committed marks (None: not recorded)."""
+        row = self.con.execute(
+            "SELECT size FROM output WHERE path = ?", (str(Path(out_file).resolve()),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def written(self, out_file: Path, size: int) -> None:
+        """*out_file* now ends at *size*; committed with the next marks."""
+        self.con.execute(
+            "INSERT OR REPLACE INTO output VALUES (?,?)",
+            (str(Path(out_file).resolve()), size),
+        )
+
+    def commit(self) -> None:
+        self.con.commit()
+
+    def close(self) -> None:
+        self.con.commit()
+        self.con.close()
+
+    def __enter__(self) -> "DumpState":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
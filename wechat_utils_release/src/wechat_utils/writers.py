@@ -0,0 +1,308 @@
+"""
+wechat_utils.writers  –  streaming output backends for wechat-dump
+
+Each writer receives one Conversation at a time, so memory stays bounded
+by the largest single chat instead of the whole backup.  A ChatStream
+goes further: its messages arrive in batches and are written as they
+come, so not even one chat has to be held in memory.  ParquetWriter takes
+ChatRows – raw row batches – and writes a columnar dataset (needs pyarrow).
+"""
+from __future__ import annotations
+
+import json
+import os
+from contextlib import nullcontext
+from dataclasses import asdict
+from pathlib import Path
+from typing import IO, Any, ContextManager, Dict, Iterator, List, Tuple, Type
+
+from .profiling import Profile
+
+COMPACT = {"ensure_ascii": False, "separators": (",", ":")}
+
+
+class ChatStream:
+    """A conversation whose messages arrive lazily, batch by batch, in order."""
+
+    def __init__(self, header: dict, batches: Iterator[List[dict]]) -> None:
+        self.header = header
+        self.first_ts: str | None = None
+        self.last_ts: str | None = None
+        self.message_count = 0
+        self._batches = batches
+
+    def __iter__(self) -> Iterator[List[dict]]:
+        for batch in self._batches:
+            if self.first_ts is None:
+                self.first_ts = batch[0]["timestamp"]
+            self.last_ts = batch[-1]["timestamp"]
+            self.message_count += len(batch)
+            yield batch
+
+    def trailer(self) -> dict:
+        """The fields that follow "messages" – only known once consumed."""
+        return {
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "message_count": self.message_count,
+        }
+
+
+class ChatRows:
+    """
+    A conversation as raw (CreateTime, Des, Type, Message, MesLocalID)
+    row batches for columnar writers – no per-message dicts at all.
+    """
+
+    def __init__(self, header: dict, batches: Iterator[List[tuple]]) -> None:
+        self.header = header          # account_uid, chat_hash, usrname, chat_type …
+        self.message_count = 0
+        self._batches = batches
+
+    def __iter__(self) -> Iterator[List[tuple]]:
+        for batch in self._batches:
+            self.message_count += len(batch)
+            yield batch
+
+
+def as_record(conv) -> dict:
+    """Conversation dataclass, ChatStream or record dict → dict."""
+    if isinstance(conv, dict):
+        return conv
+    if isinstance(conv, ChatStream):
+        record = dict(conv.header)
+        record["messages"] = [msg for batch in conv for msg in batch]
+        record.update(conv.trailer())
+        return record
+    return asdict(conv)
+
+
+def _indent(text: str, width: int) -> str:
+    """Shift every line of json.dumps output; '\n' only occurs between tokens."""
+    pad = " " * width
+    return pad + text.replace("\n", "\n" + pad)
+
+
+class ConversationWriter:
+    """
+    Base class: write conversations one by one to *out_file*.  With a
+    *profile*, the time spent writing output goes to its "write" stage.
+    """
+
+    def __init__(self, out_file: Path, append: bool = False,
+                 profile: Profile | None = None) -> None:
+        self.out_file = Path(out_file)
+        self.count = 0
+        self.profile = profile
+
+    def _writing(self) -> ContextManager[None]:
+        """Context that times one output write (a no-op without a profile)."""
+        return self.profile.stage("write") if self.profile is not None else nullcontext()
+
+    def write(self, conv) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ConversationWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class TextFileWriter(ConversationWriter):
+    """A writer backed by one UTF-8 text file."""
+
+    def __init__(self, out_file: Path, append: bool = False,
+                 profile: Profile | None = None) -> None:
+        super().__init__(out_file, append, profile)
+        self._fh: IO[str] = open(self.out_file, "a" if append else "w", encoding="utf-8")
+        if profile is not None:
+            self._fh = profile.wrap_file(self._fh)
+
+    def flush(self) -> None:
+        self._fh.flush()
+
+    def size(self) -> int:
+        """Bytes written to disk so far (call after flush)."""
+        return os.fstat(self._fh.fileno()).st_size
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class JsonArrayWriter(TextFileWriter):
+    """Pretty JSON array – byte-identical to json.dump(list, indent=2)."""
+
+    def write(self, conv) -> None:
+        self._fh.write("[\n" if self.count == 0 else ",\n")
+        if isinstance(conv, ChatStream):
+            self._write_stream(conv)
+        else:
+            text = json.dumps(as_record(conv), ensure_ascii=False, indent=2)
+            self._fh.write(_indent(text, 2))
+        self.count += 1
+
+    def _write_stream(self, stream: ChatStream) -> None:
+        head = json.dumps(stream.header, ensure_ascii=False, indent=2)
+        self._fh.write(_indent(head[:-2] + ',\n  "messages": [', 2))
+        sep = "\n"
+        for batch in stream:
+            text = json.dumps(batch, ensure_ascii=False, indent=2)
+            self._fh.write(sep + _indent(text[2:-2], 4))
+            sep = ",\n"
+        tail = json.dumps(stream.trailer(), ensure_ascii=False, indent=2)
+        self._fh.write("\n    ]," + tail[1:].replace("\n", "\n  "))
+
+    def close(self) -> None:
+        self._fh.write("\n]" if self.count else "[]")
+        super().close()
+
+
+class NdjsonWriter(TextFileWriter):
+    """Compact newline-delimited JSON – one conversation per line."""
+
+    def write(self, conv) -> None:
+        if isinstance(conv, ChatStream):
+            self._write_stream(conv)
+        else:
+            self._fh.write(json.dumps(as_record(conv), **COMPACT))
+        self._fh.write("\n")
+        self.count += 1
+
+    def _write_stream(self, stream: ChatStream) -> None:
+        head = json.dumps(stream.header, **COMPACT)
+        self._fh.write(head[:-1] + ',"messages":[')
+        sep = ""
+        for batch in stream:
+            text = json.dumps(batch, **COMPACT)
+            self._fh.write(sep + text[1:-1])
+            sep = ","
+        tail = json.dumps(stream.trailer(), **COMPACT)
+        self._fh.write("]," + tail[1:])
+
+
+def _pyarrow() -> Tuple[Any, Any]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:          # optional dependency
+        raise RuntimeError(
+            "Parquet output needs pyarrow – pip install 'wechat-utils[parquet]'"
+        ) from exc
+    return pa, pq
+
+
+def parquet_schema():
+    """Fixed file schema; account and chat_kind live in the partition path."""
+    pa, _ = _pyarrow()
+    return pa.schema([
+        ("chat_hash", pa.string()),
+        ("usrname", pa.string()),
+        ("direction", pa.string()),
+        ("msg_type", pa.int32()),
+        ("create_time", pa.int64()),
+        ("body", pa.string()),
+        ("mes_local_id", pa.int64()),
+    ])
+
+
+def _text(value) -> str | None:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+class ParquetWriter(ConversationWriter):
+    """
+    Hive-partitioned Parquet dataset in the directory *out_file*:
+    account=<uid>/chat_kind=<PP|GRP|OA>/part-0.parquet.
+
+    Rows are buffered per partition and written as a row group every
+    *row_group_size* rows, so memory is bounded by the open partitions, not
+    by the backup.  Partitions of an account are closed once the next
+    account starts (conversations arrive grouped by account).
+    """
+
+    row_group_size = 65_536
+
+    def __init__(self, out_file: Path, append: bool = False,
+                 profile: Profile | None = None) -> None:
+        if append:
+            raise ValueError("Parquet output cannot be appended to")
+        super().__init__(out_file, profile=profile)
+        self._pa, self._pq = _pyarrow()
+        self.schema = parquet_schema()
+        self.out_file.mkdir(parents=True, exist_ok=True)
+        self.rows = 0
+        self._account: str | None = None
+        self._parts: Dict[str, Tuple[Any, Dict[str, list]]] = {}   # kind → (writer, columns)
+
+    def write(self, conv) -> None:
+        if not isinstance(conv, ChatRows):
+            raise TypeError("ParquetWriter takes ChatRows (build=make_rows)")
+        header = conv.header
+        if header["account_uid"] != self._account:
+            self._close_parts()
+            self._account = header["account_uid"]
+        for batch in conv:
+            columns = self._columns(header["chat_type"])
+            ts_col, des_col, type_col, body_col, id_col = zip(*batch)
+            columns["chat_hash"].extend([header["chat_hash"]] * len(batch))
+            columns["usrname"].extend([header["usrname"]] * len(batch))
+            columns["direction"].extend(["out" if des == 1 else "in" for des in des_col])
+            columns["msg_type"].extend(type_col)
+            columns["create_time"].extend(ts_col)
+            columns["body"].extend(map(_text, body_col))
+            columns["mes_local_id"].extend(id_col)
+            if len(columns["create_time"]) >= self.row_group_size:
+                self._flush(header["chat_type"])
+            self.rows += len(batch)
+        self.count += 1
+
+    def _columns(self, kind: str) -> Dict[str, list]:
+        if kind not in self._parts:
+            part_dir = self.out_file / f"account={self._account}" / f"chat_kind={kind}"
+            part_dir.mkdir(parents=True, exist_ok=True)
+            writer = self._pq.ParquetWriter(part_dir / "part-0.parquet", self.schema)
+            self._parts[kind] = (writer, {name: [] for name in self.schema.names})
+        return self._parts[kind][1]
+
+    def _flush(self, kind: str) -> None:
+        writer, columns = self._parts[kind]
+        if columns["create_time"]:
+            table = self._pa.table(columns, schema=self.schema)
+            with self._writing():
+                writer.write_table(table)
+            for col in columns.values():
+                col.clear()
+
+    def _close_parts(self) -> None:
+        for kind in list(self._parts):
+            self._flush(kind)
+            with self._writing():               # the file footer
+                self._parts.pop(kind)[0].close()
+
+    def flush(self) -> None:
+        for kind in self._parts:
+            self._flush(kind)
+
+    def close(self) -> None:
+        self._close_parts()
+
+
+WRITERS: Dict[str, Type[ConversationWriter]] = {
+    "json": JsonArrayWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def open_writer(fmt: str, out_file: Path, append: bool = False,
+                profile: Profile | None = None) -> ConversationWriter:
+    return WRITERS[fmt](out_file, append, profile)
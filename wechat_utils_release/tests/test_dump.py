@@ -0,0 +1,416 @@
+from click.testing import CliRunner
+from pathlib import Path
+from wechat_utils.mockgen import build_container
+from wechat_utils.dump import cli as dump_cli
+import json
+import pytest
+
+@pytest.fixture(autouse=True)
+def user_cache(tmp_path:Path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME',str(tmp_path/'cache'))
+    return tmp_path/'cache'
+
+def test_dump_ndjson(tmp_path:Path):
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,5,2)
+    out=tmp_path/'dump.ndjson'
+    res=CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--format','ndjson'])
+    assert res.exit_code==0
+    lines=out.read_text().splitlines()
+    assert len(lines)==3
+    assert all(json.loads(l)['message_count']==10 for l in lines)
+
+def test_dump_jobs_matches_sequential(tmp_path:Path):
+    cont=tmp_path/'mock'
+    build_container(cont,2,3,4,3)
+    outs=[]
+    for jobs in ('1','3'):
+        out=tmp_path/f'dump_{jobs}.json'
+        res=CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--jobs',jobs])
+        assert res.exit_code==0
+        outs.append(out.read_text())
+    assert outs[0]==outs[1]
+    assert len(json.loads(outs[0]))==6
+
+def test_dump_incremental_state(tmp_path:Path):
+    import sqlite3
+    from wechat_utils import dump
+    for jobs in ('1','2'):
+        cont=tmp_path/f'mock{jobs}'
+        build_container(cont,1,3,5,2)
+        acc=dump.scan_accounts(cont)[0]
+        out=tmp_path/f'dump{jobs}.ndjson'
+        args=[str(cont),'-o',str(out),'--format','ndjson','--jobs',jobs,
+              '--state',str(tmp_path/f'state{jobs}.db')]
+        assert CliRunner().invoke(dump_cli,args).exit_code==0
+        assert len(out.read_text().splitlines())==3
+        assert CliRunner().invoke(dump_cli,args).exit_code==0
+        assert len(out.read_text().splitlines())==3
+        with sqlite3.connect(acc/'DB'/'message_1.sqlite') as con:
+            h,tbl=dump.list_chat_tables(con)[0]
+            ts=con.execute(f"SELECT max(CreateTime) FROM {tbl}").fetchone()[0]+60
+            con.execute(f"INSERT INTO {tbl}(CreateTime,Des,Type,Message) VALUES (?,1,1,'new row')",(ts,))
+        assert CliRunner().invoke(dump_cli,args).exit_code==0
+        lines=out.read_text().splitlines()
+        assert len(lines)==4
+        added=json.loads(lines[-1])
+        assert added['usrname']==dump.load_contacts(acc/'DB'/'WCDB_Contact.sqlite')[h][0]
+        assert added['message_count']==1
+        assert [(m['body'],m['direction'],m['timestamp']) for m in added['messages']]== \
+            [('new row','out',dump.utc_iso_fast(ts))]
+        assert CliRunner().invoke(dump_cli,args).exit_code==0
+        assert len(out.read_text().splitlines())==4
+
+KILL_MID_WRITE = """
+import os, signal, sys
+from wechat_utils import dump, writers
+dump.BATCH_SIZE = 2
+write_stream = writers.NdjsonWriter._write_stream
+def dying(self, stream):
+    if self.count == 1:                 # second conversation: half of it, then SIGKILL
+        stream._batches = iter([next(stream._batches)])
+        write_stream(self, stream)
+        self._fh.flush()
+        os.kill(os.getpid(), signal.SIGKILL)
+    write_stream(self, stream)
+writers.NdjsonWriter._write_stream = dying
+dump.cli(sys.argv[1:])
+"""
+
+def test_dump_resumes_after_kill(tmp_path:Path):
+    import os, subprocess, sys
+    import wechat_utils
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,5,2)
+    out=tmp_path/'dump.ndjson'
+    args=[str(cont),'-o',str(out),'--format','ndjson','--state',str(tmp_path/'state.db')]
+    env={**os.environ,'PYTHONPATH':str(Path(wechat_utils.__file__).parent.parent)}
+    killed=subprocess.run([sys.executable,'-c',KILL_MID_WRITE,*args],env=env)
+    assert killed.returncode==-9
+    assert len(out.read_text().splitlines())==2          # one line, one fragment
+    assert CliRunner().invoke(dump_cli,args).exit_code==0
+    resumed=[json.loads(line) for line in out.read_text().splitlines()]
+    full=tmp_path/'full.ndjson'
+    assert CliRunner().invoke(dump_cli,[str(cont),'-o',str(full),'--format','ndjson']).exit_code==0
+    assert sorted(resumed,key=lambda c:c['usrname'])== \
+        sorted(map(json.loads,full.read_text().splitlines()),key=lambda c:c['usrname'])
+
+def test_make_record_matches_dataclass():
+    from dataclasses import asdict
+    from wechat_utils.dump import make_conversation, make_record
+    rows=[(1700000000,1,1,'b',2),(1600000000,0,3,'a',1),(1700000000,0,1,'c',None)]
+    contacts={'h':('wxid_x','X')}
+    assert make_record('acc','h',list(rows),contacts)==asdict(make_conversation('acc','h',list(rows),contacts))
+
+def test_stream_writers_match_records(tmp_path:Path, monkeypatch):
+    from wechat_utils import dump
+    from wechat_utils.writers import open_writer
+    cont=tmp_path/'mock'
+    build_container(cont,1,2,7,3)
+    acc=dump.scan_accounts(cont)[0]
+    monkeypatch.setattr(dump,'BATCH_SIZE',4)
+    for fmt in ('json','ndjson'):
+        texts=[]
+        for build in (dump.make_record,dump.make_stream):
+            out=tmp_path/f'{build.__name__}.{fmt}'
+            with open_writer(fmt,out) as w:
+                for conv in dump.iter_conversations(acc,None,None,build=build):
+                    w.write(conv)
+            texts.append(out.read_text())
+        assert texts[0]==texts[1]
+
+def test_window_pushdown_matches_full_scan(tmp_path:Path, monkeypatch):
+    import sqlite3
+    from wechat_utils import dump
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,20,3)
+    acc=dump.scan_accounts(cont)[0]
+    shard=acc/'DB'/'message_2.sqlite'
+    with sqlite3.connect(shard) as con:
+        tbl=[h for h,_ in dump.list_chat_tables(con)][0]
+        con.execute(f"CREATE INDEX Chat_{tbl}_ct ON Chat_{tbl}(CreateTime)")
+    t_min,t_max=dump.build_window(None,None,12,None)
+    pruned=dump.build_conversations(acc,t_min,t_max)
+    assert (acc/'DB'/'wechat_utils.catalog.json').is_file()
+    assert dump.plan_shards(acc/'DB',0,1)==[]
+    monkeypatch.setattr(dump,'plan_shards',lambda db_dir,lo,hi:[(p,None) for p in dump.db_chain(db_dir)])
+    assert pruned==dump.build_conversations(acc,t_min,t_max)
+
+def test_catalog_cached_in_process_and_in_user_dir(tmp_path:Path, user_cache:Path, monkeypatch):
+    import sqlite3
+    from wechat_utils import catalog
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,5,3)
+    db_dir=next(cont.rglob('WCDB_Contact.sqlite')).parent
+    (db_dir/catalog.CATALOG_NAME).mkdir()          # unwritable cache file, as on a read-only backup
+    shards=catalog.shard_chain(db_dir)
+    first=catalog.load_catalog(db_dir,shards)
+    assert list((user_cache/'wechat_utils').glob('catalog-*.json'))
+    scans=[]
+    monkeypatch.setattr(catalog,'describe_shard',lambda p,f=catalog.describe_shard:scans.append(p) or f(p))
+    assert catalog.load_catalog(db_dir,shards)==first and not scans
+    catalog._MEMO.clear()
+    assert catalog.load_catalog(db_dir,shards)==first and not scans
+    with sqlite3.connect(shards[0]) as con:
+        con.execute(f"DELETE FROM {next(iter(first[shards[0].name]))}")
+    catalog.load_catalog(db_dir,shards)
+    assert scans==[shards[0]]
+
+def test_contact_cache_invalidated_by_mtime(tmp_path:Path, user_cache:Path, monkeypatch):
+    import os, sqlite3
+    from wechat_utils import contacts
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,1,1)
+    db=next(cont.rglob('WCDB_Contact.sqlite'))
+    before=sorted(p.name for p in db.parent.iterdir())
+    first=contacts.contact_map(db)
+    assert len(first)==3 and list((user_cache/'wechat_utils').glob('contacts-*.json'))
+    assert sorted(p.name for p in db.parent.iterdir())==before     # backup tree untouched
+    contacts._LRU.clear()
+    reads=[]
+    monkeypatch.setattr(contacts,'_read_friends',lambda p,f=contacts._read_friends:reads.append(p) or f(p))
+    assert contacts.contact_map(db)==first and not reads
+    with sqlite3.connect(db) as con:
+        con.execute("INSERT INTO Friend VALUES ('wxid_new','New','')")
+    os.utime(db,ns=(0,10**18))
+    assert len(contacts.contact_map(db))==4
+
+def test_fast_mockgen_parallel(tmp_path:Path):
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,40,2,fast=True,jobs=2)
+    out=tmp_path/'dump.json'
+    assert CliRunner().invoke(dump_cli,[str(cont),'-o',str(out)]).exit_code==0
+    data=json.loads(out.read_text())
+    assert [c['message_count'] for c in data]==[80,80,80]
+    assert all(m['mes_local_id'] is not None for c in data for m in c['messages'])
+
+def test_mockgen_seed_reproducible(tmp_path:Path):
+    import sqlite3
+    from wechat_utils import mockgen
+    def snapshot(root):
+        out=[]
+        for db in sorted(root.rglob('*.sqlite')):
+            con=sqlite3.connect(db)
+            tables=[t for (t,) in con.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+            cols={t:'Type,Message,Des' if t.startswith('Chat_') else '*' for t in tables}
+            out.append((str(db.relative_to(root)),[(t,con.execute(f"SELECT {cols[t]} FROM {t} ORDER BY rowid").fetchall()) for t in tables if not t.startswith('ChatExt2_')]))
+            con.close()
+        return out
+    for fast in (False,True):
+        snaps=[]
+        for run in 'ab':
+            mockgen.seed(7)
+            build_container(tmp_path/f'{run}{fast}',1,3,4,2,fast=fast)
+            snaps.append(snapshot(tmp_path/f'{run}{fast}'))
+        assert snaps[0]==snaps[1] and snaps[0]
+
+def test_bench_suite_report():
+    import resource
+    from wechat_utils.bench import parse_sizes, run_suite
+    ballast=b'x'*(256<<20)          # the worker must not report our peak RSS
+    report=run_suite(parse_sizes('3x5x2'),seed=7)
+    case,=report['cases']
+    assert case['rows']==30 and case['size']=={'contacts':3,'messages':5,'slices':2}
+    assert {'generate','discovery','contacts','dump'}<=set(case['stages'])
+    assert 0<case['peak_rss_kib']<resource.getrusage(resource.RUSAGE_SELF).ru_maxrss-(128<<10)
+    del ballast
+
+def test_dump_parquet_partitions(tmp_path:Path):
+    import pytest
+    pq=pytest.importorskip('pyarrow.parquet')
+    cont=tmp_path/'mock'
+    build_container(cont,2,3,4,2)
+    out=tmp_path/'dump.parquet'
+    res=CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--format','parquet'])
+    assert res.exit_code==0
+    parts=sorted(p.relative_to(out).parts[:2] for p in out.rglob('*.parquet'))
+    assert len(parts)==2 and all(kind=='chat_kind=PP' for _,kind in parts)
+    table=pq.read_table(out)
+    assert table.num_rows==2*3*4*2
+    assert table.schema.field('create_time').type=='int64'
+    ref=tmp_path/'dump.ndjson'
+    CliRunner().invoke(dump_cli,[str(cont),'-o',str(ref),'--format','ndjson'])
+    bodies=sorted(m['body'] for l in ref.read_text().splitlines() for m in json.loads(l)['messages'])
+    assert sorted(table.column('body').to_pylist())==bodies
+
+def test_search_index_incremental(tmp_path:Path):
+    import sqlite3
+    from wechat_utils.search import build_index, search
+    cont=tmp_path/'mock'
+    build_container(cont,1,2,5,1)
+    idx=tmp_path/'idx.db'
+    first=build_index(cont,idx,types=None)
+    assert first==10 and build_index(cont,idx,types=None)==0
+    shard=next(cont.rglob('message_1.sqlite'))
+    tbl=next(t for (t,) in sqlite3.connect(shard).execute("SELECT name FROM sqlite_master WHERE name LIKE 'Chat\\_%' ESCAPE '\\' AND name NOT LIKE 'ChatExt2%'"))
+    con=sqlite3.connect(shard)
+    con.execute(f"INSERT INTO {tbl}(CreateTime,Des,Type,Message) VALUES (2000000000,1,1,'needle in the haystack')")
+    con.commit(); con.close()
+    assert build_index(cont,idx,types=None)==1
+    hits=search(idx,'needle haystack')
+    assert len(hits)==1 and hits[0]['chat']==tbl[5:] and '[needle]' in hits[0]['snippet']
+
+def duplicate_chat(acc:Path, svr_id:bool=True)->str:
+    """
+    Copy shard 1's first chat into shard 2, as a migration leaves it, and
+    return its table.  *svr_id*: both shards get a MesSvrID column and the
+    copies share it; otherwise the copies only keep shard 1's MesLocalID,
+    which is no cross-shard identity.
+    """
+    import sqlite3
+    from wechat_utils.catalog import CHAT_TABLES_SQL, shard_chain
+    s1,s2=shard_chain(acc/'DB')[:2]
+    con=sqlite3.connect(s1)
+    tbl=con.execute(CHAT_TABLES_SQL).fetchone()[0]
+    con.close()
+    if svr_id:
+        for shard in (s1,s2):
+            con=sqlite3.connect(shard)
+            con.execute(f"ALTER TABLE {tbl} ADD COLUMN MesSvrID INTEGER")
+            con.execute(f"UPDATE {tbl} SET MesSvrID=rowid+{1000 if shard==s2 else 0}")
+            con.commit(); con.close()
+    con=sqlite3.connect(s2)
+    con.execute(f"ATTACH '{s1}' AS old")
+    if svr_id:
+        con.execute(f"INSERT INTO {tbl}(CreateTime,Des,Type,Message,MesSvrID) SELECT CreateTime,Des,Type,Message,MesSvrID FROM old.{tbl}")
+    else:
+        con.execute(f"INSERT INTO {tbl}(CreateTime,Des,Type,Message,MesLocalID) SELECT CreateTime,Des,Type,Message,rowid FROM old.{tbl}")
+        con.execute(f"UPDATE old.{tbl} SET MesLocalID=rowid")
+    con.commit(); con.close()
+    return tbl
+
+def test_dump_drops_cross_shard_duplicates(tmp_path:Path):
+    from wechat_utils import dump
+    cont=tmp_path/'mock'
+    build_container(cont,1,2,5,2)
+    acc=dump.scan_accounts(cont)[0]
+    duplicate_chat(acc)
+    counts={c.usrname:c.message_count for c in dump.iter_conversations(acc,None,None)}
+    assert sorted(counts.values())==[10,10]
+    par={c['usrname']:c['message_count'] for c in dump.iter_conversations_parallel([acc],None,None,2,build=dump.make_record)}
+    assert par==counts
+
+def test_dump_keeps_rows_sharing_local_ids(tmp_path:Path):
+    import sqlite3
+    from wechat_utils import dump
+    from wechat_utils.catalog import shard_chain
+    cont=tmp_path/'mock'
+    build_container(cont,1,2,5,2)
+    acc=dump.scan_accounts(cont)[0]
+    tbl=duplicate_chat(acc,svr_id=False)
+    s2=shard_chain(acc/'DB')[1]
+    con=sqlite3.connect(s2)
+    con.execute(f"UPDATE {tbl} SET Message='other body '||rowid")
+    con.commit(); con.close()
+    counts={c.usrname:c.message_count for c in dump.iter_conversations(acc,None,None)}
+    assert sorted(counts.values())==[10,15]
+
+def test_read_page_walks_shards_with_dedup(tmp_path:Path):
+    from wechat_utils import dump
+    from wechat_utils.catalog import load_catalog
+    from wechat_utils.paging import read_page
+    cont=tmp_path/'mock'
+    build_container(cont,1,2,7,3)
+    acc=dump.scan_accounts(cont)[0]
+    tbl=duplicate_chat(acc)
+    cons=[dump.open_ro(p) for p in dump.db_chain(acc/'DB')]
+    try:
+        rows=dump.merge_rows([dump.ShardRows(f'{i}',con,tbl,None,None,key_sql=dump.dedup_key_sql(con,tbl)) for i,con in enumerate(cons)],keyed=True)
+        expected=dump.message_dicts(list(rows))
+    finally:
+        for con in cons: con.close()
+    held=load_catalog(acc/'DB',dump.db_chain(acc/'DB'))
+    for limit,cat in ((1,None),(4,held),(21,None),(50,held)):
+        got,token=[],None
+        while True:
+            page=read_page(acc,tbl[5:],limit,token,catalog=cat)
+            assert len(page.messages)<=limit
+            got+=page.messages; token=page.next_token
+            if token is None: break
+        assert got==expected and len(got)==21
+
+def test_decode_token_rejects_malformed_fields():
+    import base64
+    from wechat_utils.paging import TOKEN_VERSION, decode_token, encode_token
+    assert decode_token(encode_token('h',(1,2,3),[]),'h')==((1,2,3),[])
+    def forged(*fields):
+        return base64.urlsafe_b64encode(json.dumps([TOKEN_VERSION,'h',*fields]).encode()).decode()
+    for bad in (forged('x',0,0,[]),forged([1],0,0,[]),forged(None,0,0,[]),forged(1,0,0,5),
+                forged(float('inf'),0,0,[]),forged(1,0,0),'%%%'):
+        with pytest.raises(ValueError,match='malformed'):
+            decode_token(bad,'h')
+    with pytest.raises(ValueError,match='another chat'):
+        decode_token(encode_token('h',(1,2,3),[]),'other')
+
+def test_discover_accounts_walks_and_caches(tmp_path:Path, user_cache:Path):
+    from wechat_utils import discovery
+    root=tmp_path/'backup'
+    build_container(root/'a'/'b',1,2,2,1)
+    (root/'AppDomain-com.other'/'Documents'/'x'/'DB').mkdir(parents=True)
+    (root/'AppDomain-com.other'/'Documents'/'x'/'DB'/'WCDB_Contact.sqlite').touch()
+    found=discovery.discover_accounts(root)
+    assert len(found)==1 and found[0].parent.parent.name=='AppDomain-com.tencent.xin'
+    assert list((user_cache/'wechat_utils').glob('accounts-*.json'))
+    assert not list(root.glob('wechat_utils.*'))
+    discovery._MEMO.clear()
+    assert discovery.discover_accounts(root)==found
+    extra=found[0].parent/'newuid'/'DB'
+    extra.mkdir(parents=True); (extra/'WCDB_Contact.sqlite').touch()
+    assert len(discovery.discover_accounts(root))==2
+    # a contact DB appearing in an existing, so far empty uid folder
+    late=found[0].parent/'lateuid'/'DB'
+    late.mkdir(parents=True)
+    assert len(discovery.discover_accounts(root))==2
+    (late/'WCDB_Contact.sqlite').touch()
+    assert len(discovery.discover_accounts(root))==3
+    # a second backup copied in elsewhere in the tree
+    build_container(root/'c',1,1,1,1)
+    assert len(discovery.discover_accounts(root))==4
+
+def test_rediscover_flag_bypasses_cache(tmp_path:Path, monkeypatch):
+    from wechat_utils import discovery
+    cont=tmp_path/'mock'
+    build_container(cont,1,2,2,1)
+    out=tmp_path/'dump.json'
+    assert CliRunner().invoke(dump_cli,[str(cont),'-o',str(out)]).exit_code==0
+    walked=[]
+    monkeypatch.setattr(discovery,'accounts_in',lambda d,f=discovery.accounts_in:walked.append(d) or f(d))
+    assert CliRunner().invoke(dump_cli,[str(cont),'-o',str(out)]).exit_code==0
+    assert not walked
+    assert CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--rediscover']).exit_code==0
+    assert walked
+
+def test_stats_match_full_dump(tmp_path:Path):
+    from collections import Counter
+    from wechat_utils import dump
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,6,2)
+    acc=dump.scan_accounts(cont)[0]
+    duplicate_chat(acc,svr_id=False)
+    out=tmp_path/'stats.ndjson'
+    res=CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--format','ndjson','--stats'])
+    assert res.exit_code==0, res.output
+    stats={s['usrname']:s for s in map(json.loads,out.read_text().splitlines())}
+    for conv in dump.iter_conversations(acc,None,None,build=dump.make_record):
+        s=stats[conv['usrname']]
+        msgs=conv['messages']
+        assert (s['message_count'],s['first_ts'],s['last_ts'])==(conv['message_count'],conv['first_ts'],conv['last_ts'])
+        assert s['outgoing']==sum(m['direction']=='out' for m in msgs) and s['incoming']+s['outgoing']==len(msgs)
+        assert s['types']=={str(k):v for k,v in sorted(Counter(m['msg_type'] for m in msgs).items())}
+    assert len(stats)==3
+    res=CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--format','ndjson','--stats','-j','2'])
+    assert res.exit_code==2 and '--jobs' in res.output
+
+def test_profile_report(tmp_path:Path):
+    cont=tmp_path/'mock'
+    build_container(cont,1,3,4,2)
+    for fmt in ('ndjson','parquet'):
+        out=tmp_path/f'd.{fmt}'; rep=tmp_path/f'prof-{fmt}.json'
+        res=CliRunner().invoke(dump_cli,[str(cont),'-o',str(out),'--format',fmt,'--profile',str(rep)])
+        assert res.exit_code==0 and 'DEBUG' not in res.output, res.output
+        report=json.loads(rep.read_text())
+        assert set(report['stages'])>={'discovery','contacts','scan','serialize','write'}
+        size=(sum(p.stat().st_size for p in out.rglob('*') if p.is_file()) if out.is_dir()
+              else out.stat().st_size)
+        assert report['rows']==24 and report['conversations']==3 and report['bytes_written']==size
+        assert sum(s['rows'] for s in report['shards'].values())==24